@@ -1,18 +1,26 @@
-import groundlight
-import framegrab
-
 import time
 import logging
 import argparse
 
-import object_tracking as ot
 import camera as cam
+import frame_memory as fm
+import image_utils as iu
+from config_watcher import ConfigWatcher
+from resolution_controller import DetectionResolutionController
+from inference_client import InferenceClient, ask_ml_within, create_groundlight_client
+from throughput import ThroughputRollups, add_throughput_endpoints
 from timing import PerfTimer, LoopManager
-import yaml
 from enums import AppMode, RecordingMode
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+# Heavy dependencies (groundlight, framegrab, flask) are imported where they are needed, so that modes
+# which don't use them start faster.
 
-from framegrab_web_server import FrameGrabWebServer
+logger = logging.getLogger(__name__)
+
+# Config sections that are applied while the app is running. Changes to anything else require a restart.
+RELOADABLE_CONFIG_KEYS = ('fps', 'detector_ids', 'tracker', 'inference')
     
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -37,35 +45,46 @@ def parse_args():
   
     return parser.parse_args()
 
+def connect_to_groundlight(endpoint: str, detector_id: str) -> tuple:
+    """
+    Create the Groundlight clients, then check who we're logged in as and fetch the detector concurrently.
+    Per-frame inference gets its own client without the SDK's retries, so that a request the main loop
+    has given up on isn't sent again.
+    """
+    import groundlight
+    logger.info(f'Groundlight Version: {groundlight.__version__}')
+    
+    gl = create_groundlight_client(endpoint)
+    inference_gl = create_groundlight_client(endpoint, sdk_retries=False)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        logged_in_user = executor.submit(gl.whoami)
+        detector = executor.submit(gl.get_detector, detector_id)
+        logger.info(f'Welcome, {logged_in_user.result()}')
+        return gl, inference_gl, detector.result()
+    
+def inference_deadlines(inference_config: dict, loop_time: float) -> tuple[float, float | None]:
+    """
+    Returns the inference deadline and hedging delay for the given frame period.
+    """
+    # Tie the inference deadline to the frame period so that one slow request can't stall the main loop
+    deadline = loop_time * inference_config.get('deadline_fraction', 0.8)
+    hedge_fraction = inference_config.get('hedge_fraction')
+    hedge_after = None if hedge_fraction is None else loop_time * hedge_fraction
+    return deadline, hedge_after
+
 def main() -> None:
+    startup_time = time.perf_counter()
+    
     root_logger = logging.getLogger()
     if root_logger.hasHandlers():
         root_logger.handlers.clear()
     
     args = parse_args()
     logging.basicConfig(level=getattr(logging, args.log_level.upper()))
-    logger = logging.getLogger(__name__)
-
-    logger.info(f'Groundlight Version: {groundlight.__version__}')
-    logger.info(f'Framegrab Version: {framegrab.__version__}')
     
     yaml_path = 'config.yaml'
-    with open(yaml_path, 'r') as file:
-        config = yaml.safe_load(file)
-        
-    if args.app_mode in (AppMode.VIDEO_INFERENCE, AppMode.SNAPSHOT_INFERENCE):
-        gl = groundlight.ExperimentalApi(endpoint="http://localhost:30101/")
-        logged_in_user = gl.whoami()
-        logger.info(f'Welcome, {logged_in_user}')
-            
-        counting_detector_id = config["detector_ids"]["counting"]
-        counting_detector = gl.get_detector(counting_detector_id)
-        counting_timer = PerfTimer("Counting", False)
-    else:
-        logger.info('Inference disabled. Streaming camera only.')
-        
-    if args.app_mode == AppMode.VIDEO_INFERENCE:
-        object_tracker = ot.ObjectTracker(0.4, 0.0)
+    config_watcher = ConfigWatcher(yaml_path)
+    config = config_watcher.config
     
     FPS = config.get('fps')
     if FPS is None:
@@ -77,25 +96,120 @@ def main() -> None:
     
         
     MAIN_LOOP_TIME = 1 / FPS
+        
+    inference_enabled = args.app_mode in (AppMode.VIDEO_INFERENCE, AppMode.SNAPSHOT_INFERENCE)
+    inference_config = config.get('inference') or {}
+    if inference_enabled:
+        # Connect to Groundlight in the background while the camera is opening
+        warmup_executor = ThreadPoolExecutor(max_workers=1)
+        groundlight_warmup = warmup_executor.submit(
+            connect_to_groundlight,
+            inference_config.get('endpoint', 'http://localhost:30101/'),
+            config["detector_ids"]["counting"],
+        )
+        counting_timer = PerfTimer("Counting", False)
+    else:
+        logger.info('Inference disabled. Streaming camera only.')
+        
+    throughput_config = config.get('throughput') or {}
+    if args.app_mode == AppMode.VIDEO_INFERENCE:
+        import object_tracking as ot
+        
+        tracker_config = dict(config.get('tracker') or {})
+        ot.ObjectTracker.check_thresholds(tracker_config)
+        throughput = ThroughputRollups(min_idle_gap_sec=throughput_config.get('min_idle_gap_sec', 30.0))
+        object_tracker = ot.ObjectTracker(
+            tracker_config.pop('expected_x_velocity', 0.4), 
+            tracker_config.pop('expected_y_velocity', 0.0), 
+            throughput,
+        )
+        object_tracker.set_thresholds(**tracker_config)
+    else:
+        throughput = None
+        object_tracker = None
+        
+    # Optionally adapt the resolution and JPEG quality of the object detection image at runtime
+    resolution_config = config.get('detection_resolution') or {}
+    if args.app_mode == AppMode.VIDEO_INFERENCE and resolution_config.get('enabled', False):
+        resolution_controller = DetectionResolutionController(
+            frame_period=MAIN_LOOP_TIME,
+            min_width=resolution_config.get('min_width', 160),
+            max_width=resolution_config.get('max_width', 640),
+            initial_width=resolution_config.get('initial_width', 200),
+            min_jpeg_quality=resolution_config.get('min_jpeg_quality', 70),
+            max_jpeg_quality=resolution_config.get('max_jpeg_quality', 95),
+            min_object_px=resolution_config.get('min_object_px', 24),
+            max_object_px=resolution_config.get('max_object_px', 96),
+            min_confidence=resolution_config.get('min_confidence', 0.75),
+            latency_budget_fraction=resolution_config.get('latency_budget_fraction', 0.6),
+            hysteresis_frames=resolution_config.get('hysteresis_frames', 10),
+            cooldown_sec=resolution_config.get('cooldown_sec', 5.0),
+        )
+        detection_width = resolution_controller.width
+        logger.info(f'Adapting detection resolution between {resolution_controller.levels[0][0]}px and {resolution_controller.levels[-1][0]}px.')
+    else:
+        resolution_controller = None
+        detection_width = 200
+
+    # Frames held in queues and caches are capped by a process-wide budget, so slow consumers can't exhaust memory
+    fm.apply_config(config)
 
     # Connect to the camera and create a threaded framegrabber so we can capture frames more efficiently
+    import framegrab
+    logger.info(f'Framegrab Version: {framegrab.__version__}')
+    
     blocking_grabber = framegrab.FrameGrabber.from_yaml(yaml_path)[0]
-    grabber = cam.ThreadedFrameGrabber(blocking_grabber, FPS)
+    grabber = cam.ThreadedFrameGrabber(blocking_grabber, FPS, detection_width)
 
+    from framegrab_web_server import FrameGrabWebServer
     web_server = FrameGrabWebServer('Object Counter')
+    web_server.register_json_endpoint('/memory', lambda args: fm.get_budget().usage())
+    if throughput is not None:
+        add_throughput_endpoints(web_server, throughput, throughput_config.get('shift_starts', ['06:00', '14:00', '22:00']))
     
     # Get the first frames from the camera to initialize the display and the video writer (if necessary)
-    for _ in range(100):
-        time.sleep(.01)
+    if grabber.wait_for_first_frame(timeout=1.0):
         frames, timestamp = grabber.grab()
-        if frames is not None:
-            annotated_frame = frames['original']
-            web_server.show_image(annotated_frame)
-            logger.info('Got first frames from the camera.')
-            break
+        annotated_frame = frames['original']
+        web_server.show_image(annotated_frame)
+        logger.info(f'Got first frames from the camera. Time to first frame: {time.perf_counter() - startup_time:.2f} second(s).')
     else:
         logger.error('Could not get frames from the camera. Exiting.')
         exit(1)
+        
+    if inference_enabled:
+        gl, inference_gl, counting_detector = groundlight_warmup.result()
+        warmup_executor.shutdown()
+        
+    if args.app_mode == AppMode.VIDEO_INFERENCE:
+        deadline, hedge_after = inference_deadlines(inference_config, MAIN_LOOP_TIME)
+        inference_client = InferenceClient(
+            infer=lambda image, timeout: ask_ml_within(inference_gl, counting_detector, image, timeout),
+            deadline=deadline,
+            hedge_after=hedge_after,
+            max_in_flight=inference_config.get('max_in_flight', 4),
+            failure_threshold=inference_config.get('failure_threshold', 3),
+            reset_timeout=inference_config.get('reset_timeout_sec', 5.0),
+        )
+    else:
+        inference_client = None
+        
+    # Optionally collect training samples in the background while running inference on live video
+    collector_config = config.get('training_sample_collector') or {}
+    if args.app_mode == AppMode.VIDEO_INFERENCE and collector_config.get('enabled', False):
+        from sample_collector import TrainingSampleCollector
+        
+        sample_collector = TrainingSampleCollector(
+            submit=lambda image: gl.ask_async(counting_detector, image, human_review='ALWAYS'),
+            max_submissions_per_hour=collector_config.get('max_submissions_per_hour', 120),
+            confidence_thresh=collector_config.get('confidence_thresh', 0.75),
+            min_hash_distance=collector_config.get('min_hash_distance', 6),
+            novelty_hash_distance=collector_config.get('novelty_hash_distance', 20),
+        )
+        web_server.register_json_endpoint('/training_samples', lambda args: sample_collector.stats())
+        logger.info('Collecting training samples in the background. Queue depth and submission counts are served at /training_samples.')
+    else:
+        sample_collector = None
     
     # Start the video writer, if necessary
     if args.recording_mode in (RecordingMode.RAW, RecordingMode.ANNOTATED):
@@ -120,6 +234,78 @@ def main() -> None:
         
     main_loop_manager = LoopManager('Main Loop', loop_time=MAIN_LOOP_TIME)
     
+    def apply_config_changes(old_config: dict, new_config: dict) -> None:
+        """
+        Apply changes to the config file without restarting the app. Runs on the config watcher's thread.
+        The camera stays open and tracker state is kept.
+        
+        Everything is checked before anything is changed. If this raises, nothing has been applied, and the
+        watcher keeps the old config and tries again later.
+        """
+        nonlocal counting_detector
+        
+        old_inference_config = old_config.get('inference') or {}
+        new_inference_config = new_config.get('inference') or {}
+        old_tracker_config = old_config.get('tracker') or {}
+        new_tracker_config = new_config.get('tracker') or {}
+        
+        new_fps = new_config.get('fps', old_config.get('fps'))
+        if isinstance(new_fps, bool) or not isinstance(new_fps, (int, float)) or new_fps <= 0:
+            raise ValueError(f'fps must be a positive number, got {new_fps!r}')
+        loop_time = 1 / new_fps
+        if inference_client is not None:
+            new_deadline, new_hedge_after = inference_deadlines(new_inference_config, loop_time)
+        if object_tracker is not None:
+            object_tracker.check_thresholds(new_tracker_config)
+        
+        # Fetch the new detector last, since it's the slowest check
+        old_detector_id = (old_config.get('detector_ids') or {}).get('counting')
+        new_detector_id = (new_config.get('detector_ids') or {}).get('counting')
+        new_detector = None
+        if inference_enabled and new_detector_id != old_detector_id:
+            try:
+                new_detector = gl.get_detector(new_detector_id)
+            except Exception:
+                logger.error(f'Could not get detector {new_detector_id}. Still using detector {old_detector_id}.', exc_info=True)
+                raise
+        
+        if new_fps != old_config.get('fps'):
+            grabber.set_fps(new_fps)
+            main_loop_manager.set_loop_time(loop_time)
+            if resolution_controller is not None:
+                resolution_controller.set_frame_period(loop_time)
+            if video_writer is not None:
+                logger.warning(f'{video_writer.filename} will keep playing back at {video_writer.fps} FPS.')
+            logger.info(f'Now running at {new_fps} frames per second.')
+        
+        if inference_client is not None:
+            inference_client.deadline, inference_client.hedge_after = new_deadline, new_hedge_after
+            inference_client.set_limits(
+                max_in_flight=new_inference_config.get('max_in_flight', 4),
+                failure_threshold=new_inference_config.get('failure_threshold', 3),
+                reset_timeout=new_inference_config.get('reset_timeout_sec', 5.0),
+            )
+            
+        if inference_enabled:
+            if new_inference_config.get('endpoint') != old_inference_config.get('endpoint'):
+                logger.warning('Changes to the inference endpoint take effect after a restart.')
+            
+            if new_detector is not None:
+                counting_detector = new_detector
+                logger.info(f'Now using detector {new_detector_id}.')
+                
+        if object_tracker is not None and new_tracker_config != old_tracker_config:
+            object_tracker.set_thresholds(**new_tracker_config)
+            logger.info('Updated object tracker settings.')
+            
+        for key in new_config.keys() | old_config.keys():
+            if key not in RELOADABLE_CONFIG_KEYS and new_config.get(key) != old_config.get(key):
+                logger.warning(f"Changes to '{key}' in {yaml_path} take effect after a restart.")
+    
+    config_watcher.start(apply_config_changes)
+    
+    first_inference_done = False
+    
     try:
         while True:
             if args.app_mode == AppMode.SNAPSHOT_INFERENCE:
@@ -135,17 +321,55 @@ def main() -> None:
             if args.app_mode in (AppMode.VIDEO_INFERENCE, AppMode.SNAPSHOT_INFERENCE):
                 object_detection_frame = frames['object_detection']
                 
+                if resolution_controller is not None:
+                    detection_level = resolution_controller.level
+                    detection_image = iu.encode_jpeg(object_detection_frame, resolution_controller.jpeg_quality)
+                else:
+                    detection_image = object_detection_frame
+                
                 counting_timer.start()
-                try:
-                    iq = gl.ask_ml(counting_detector, object_detection_frame)
-                except Exception:
-                    logger.error(f'Encountered an unexpected error while performing inference', exc_info=True)
-                    continue
-                finally:
-                    counting_timer.stop()
+                inference_start_time = time.perf_counter()
+                if inference_client is not None:
+                    iq, inference_outcome = inference_client.ask(detection_image)
+                else:
+                    # Snapshots are taken on demand, so there's no frame period to fit the request into
+                    iq, inference_outcome = gl.ask_ml(counting_detector, detection_image), InferenceClient.ANSWERED
+                inference_latency = time.perf_counter() - inference_start_time
+                counting_timer.stop()
+                
+                confidence = None if iq is None or iq.result is None else iq.result.confidence
+                
+                if iq is not None and not first_inference_done:
+                    first_inference_done = True
+                    logger.info(f'Time to first inference: {time.perf_counter() - startup_time:.2f} second(s).')
                 
                 if args.app_mode == AppMode.VIDEO_INFERENCE:
-                    object_tracker.run(iq, timestamp, annotated_frame)
+                    if iq is not None:
+                        object_tracker.run(iq, timestamp, annotated_frame)
+                    else:
+                        # No answer for this frame, keep tracking with predicted positions instead
+                        object_tracker.predict(timestamp, annotated_frame)
+                    
+                if resolution_controller is not None:
+                    if iq is not None:
+                        resolution_controller.update(
+                            detection_level,
+                            object_detection_frame.shape,
+                            len(detection_image),
+                            inference_latency,
+                            confidence,
+                            object_tracker.observed_bbox_sizes(),
+                            object_tracker.object_count,
+                        )
+                    elif inference_outcome in (InferenceClient.TIMED_OUT, InferenceClient.FAILED):
+                        # Requests that were sent but not answered are a sign that the endpoint can't keep up.
+                        # Requests refused by the circuit breaker were never sent, so they don't count.
+                        resolution_controller.record_failure(detection_level)
+                    grabber.detection_width = resolution_controller.width
+                    
+                if sample_collector is not None and iq is not None:
+                    roi_count = 0 if iq.rois is None else len(iq.rois)
+                    sample_collector.offer(object_detection_frame, confidence, roi_count)
                     
             # Record       
             if args.recording_mode == RecordingMode.NONE:
@@ -168,8 +392,15 @@ def main() -> None:
     except KeyboardInterrupt:
         logger.info("KeyboardInterrupt received, shutting down...")
     finally:
+        config_watcher.stop()
         if video_writer is not None:
             video_writer.stop()
+        if sample_collector is not None:
+            sample_collector.stop()
+        if inference_client is not None:
+            inference_client.shutdown()
+        if resolution_controller is not None:
+            resolution_controller.log_report()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
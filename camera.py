@@ -1,4 +1,3 @@
-from framegrab import FrameGrabber
 import numpy as np
 import cv2
 import logging
@@ -6,16 +5,21 @@ import time
 import os
 
 import image_utils as iu
+import frame_memory as fm
 
-from threading import Thread, Lock
+from threading import Thread, Lock, Event
 from queue import Queue, Full, Empty
+from typing import TYPE_CHECKING
 
 from timing import LoopManager
 
+if TYPE_CHECKING:
+    from framegrab import FrameGrabber # only needed for type hints, and slow to import
+
 logger = logging.getLogger(__name__)
 
 class ThreadedVideoWriter:
-    def __init__(self, name: str, resolution: tuple, fps: int) -> None:
+    def __init__(self, name: str, resolution: tuple, fps: int, directory: str = 'video_output') -> None:
         """
         Records video in a separate thread to improve performance.
         """
@@ -23,7 +27,6 @@ class ThreadedVideoWriter:
         self.resolution = resolution
         self.fps = fps
         
-        directory = 'video_output'
         os.makedirs(directory, exist_ok=True)
         self.filename = os.path.join(directory, f"{name}.mp4")
 
@@ -36,14 +39,24 @@ class ThreadedVideoWriter:
         )
         self.run = False
         
+        # Queued frames count against the frame memory budget, and are dropped (oldest first) when 
+        # higher priority consumers need the memory
+        self._budget = fm.get_budget()
+        self._budget.register('video_writer', fm.PRIORITY_VIDEO_WRITER, self._shed)
+        
         self.thread = Thread(target=self._run_loop)
 
         self.start()
 
     def add_frame(self, frame: np.ndarray) -> None:
+        if not self._budget.reserve('video_writer', frame.nbytes):
+            logger.error("Frame memory budget exceeded! Dropping frame from the video recording.")
+            return
+        
         try:
             self.queue.put_nowait(frame)
         except Full:
+            self._budget.release('video_writer', frame.nbytes)
             logger.error("Video recorder queue full! Dropping frame.")
 
     def start(self) -> None:
@@ -66,29 +79,84 @@ class ThreadedVideoWriter:
             
             time.sleep(0.01)
             self.writer.write(frame)
+            self._budget.release('video_writer', frame.nbytes)
+            
+    def _shed(self, num_bytes: int) -> None:
+        freed_bytes = 0
+        num_dropped = 0
+        while freed_bytes < num_bytes:
+            try:
+                frame = self.queue.get_nowait()
+            except Empty:
+                break
+            self._budget.release('video_writer', frame.nbytes)
+            freed_bytes += frame.nbytes
+            num_dropped += 1
+            
+        if num_dropped > 0:
+            logger.error(f'Frame memory budget exceeded! Dropped {num_dropped} queued frame(s) from the video recording.')
         
 class ThreadedFrameGrabber:
-    def __init__(self, grabber: FrameGrabber, fps: int = 10) -> None:
+    def __init__(self, grabber: 'FrameGrabber', fps: int = 10, detection_width: int = 200) -> None:
         """
         A wrapper around framegrab.FrameGrabber that improves performance while streaming video
+        
+        detection_width: the width of the 'object_detection' frame. Can be changed while streaming.
         """
         self._setup_camera(grabber)
         self._grabber = grabber
         self._frames: dict[str, np.ndarray] = None
         
-        self._wait_time = 1 / fps
+        self._camera_loop = LoopManager('Camera Loop', 1 / fps)
+        
+        self.detection_width = detection_width
         
         self.timestamp = 0.0
         
         self._frame_lock = Lock()
+        self._first_frame_event = Event()
+        
+        # Frames being captured and resized, the latest frames and the frames the caller is working on count 
+        # against the frame memory budget. These are the highest priority consumers, so they never shed, but 
+        # new frames are dropped if they don't fit. Resizes that can't keep up with the camera are capped, so 
+        # they can't crowd out the latest frames.
+        self._budget = fm.get_budget()
+        self._budget.register('camera_resize', fm.PRIORITY_RESIZE, max_fraction=0.25)
+        self._budget.register('camera_frames', fm.PRIORITY_CAMERA)
+        self._capture_nbytes = 0 # the size of the last frame from the camera, reserved before capturing the next
+        self._frames_nbytes = 0
+        self._checked_out: tuple[dict[str, np.ndarray], int] | None = None # the frames last returned by grab()
         
         self._start()
         
     def grab(self) -> tuple[dict[str, np.ndarray], float]:
+        """
+        Returns the latest frames. They count against the frame memory budget until the next call, 
+        so callers shouldn't hold on to them after that.
+        """
         with self._frame_lock:
-            return self._frames, self.timestamp
+            previous = self._checked_out
+            self._checked_out = (self._frames, self._frames_nbytes)
+            frames, timestamp = self._frames, self.timestamp
+            
+        # The previously returned frames are released once they've been replaced and the caller is done with them
+        if previous is not None and previous[0] is not frames:
+            self._budget.release('camera_frames', previous[1])
+        return frames, timestamp
+        
+    def wait_for_first_frame(self, timeout: float) -> bool:
+        """
+        Blocks until the first frames are available. Returns False if they didn't arrive within the timeout.
+        """
+        return self._first_frame_event.wait(timeout)
+    
+    def set_fps(self, fps: float) -> None:
+        """
+        Change the rate at which frames are grabbed, without reopening the camera.
+        """
+        self._camera_loop.set_loop_time(1 / fps)
     
-    def _setup_camera(self, grabber: FrameGrabber) -> None:
+    def _setup_camera(self, grabber: 'FrameGrabber') -> None:
         """
         Enable 4K, set a reasonable frame rate, etc.
         """
@@ -108,15 +176,29 @@ class ThreadedFrameGrabber:
     
     def _start(self) -> None:
         def thread() -> None:
-            camera_loop = LoopManager('Camera Loop', self._wait_time)
+            camera_loop = self._camera_loop
             self._running = True
             while self._running:
                 camera_loop.start()
                 
-                frame = self._grabber.grab()
-                timestamp = time.perf_counter() # capture the timestamp right after grabbing the frame
-                
-                self._resize_in_thread(frame, timestamp)
+                # Reserve room for the frame before capturing it. The resize thread takes over the reservation.
+                capture_nbytes = self._capture_nbytes
+                if self._budget.reserve('camera_resize', capture_nbytes):
+                    frame = self._grabber.grab()
+                    timestamp = time.perf_counter() # capture the timestamp right after grabbing the frame
+                    
+                    if frame.nbytes != capture_nbytes: # the first frame, or the resolution changed
+                        self._budget.release('camera_resize', capture_nbytes)
+                        self._capture_nbytes = frame.nbytes
+                        if not self._budget.reserve('camera_resize', frame.nbytes):
+                            frame = None
+                    
+                    if frame is not None:
+                        self._resize_in_thread(frame, timestamp)
+                    else:
+                        logger.warning('Frame memory budget exceeded! Dropping frame from the camera.')
+                else:
+                    logger.warning('Frame memory budget exceeded! Skipping a frame from the camera.')
                 
                 camera_loop.wait()
                 
@@ -126,16 +208,37 @@ class ThreadedFrameGrabber:
         t.start()
         
     def _resize_in_thread(self, frame: np.ndarray, timestamp: float) -> None:
+        """
+        The caller must have reserved `frame.nbytes` for 'camera_resize'. It is released when the resize is done.
+        """
         def thread() -> None:
-            object_detection_frame = iu.resize(frame, max_width=200)
-            
-            with self._frame_lock:
-                self._frames = {
+            try:
+                object_detection_frame = iu.resize(frame, max_width=self.detection_width)
+                
+                # The original frame, an annotated copy and the object detection frame
+                frames_nbytes = 2 * frame.nbytes + object_detection_frame.nbytes
+                if not self._budget.reserve('camera_frames', frames_nbytes):
+                    logger.warning('Frame memory budget exceeded! Dropping frame from the camera.')
+                    return
+                
+                frames = {
                     'original': frame,
                     'annotated': frame.copy(),
                     'object_detection': object_detection_frame,
                 }
-                self.timestamp = timestamp
+                with self._frame_lock:
+                    previous_frames, previous_frames_nbytes = self._frames, self._frames_nbytes
+                    self._frames = frames
+                    self.timestamp = timestamp
+                    self._frames_nbytes = frames_nbytes
+                    checked_out = self._checked_out is not None and self._checked_out[0] is previous_frames
+                    
+                # Frames that grab() returned are released by the next call to grab() instead
+                if not checked_out:
+                    self._budget.release('camera_frames', previous_frames_nbytes)
+                self._first_frame_event.set()
+            finally:
+                self._budget.release('camera_resize', frame.nbytes)
                 
         t = Thread(target=thread, daemon=True)
         t.start()
@@ -0,0 +1,77 @@
+import logging
+import os
+import time
+import yaml
+
+from threading import Thread
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+class ConfigWatcher:
+    def __init__(self, path: str, poll_interval: float = 1.0, retry_interval: float = 30.0) -> None:
+        """
+        Loads a YAML config file and, once started, calls `on_change(old_config, new_config)` from a
+        background thread whenever the file changes. Polls the file's modification time, so it works
+        on any filesystem without extra dependencies.
+
+        Changes made between loading and starting are picked up as soon as the watcher starts.
+        If the new file can't be parsed, the change is ignored (and logged) and the previous config stays in effect.
+        If `on_change` raises, `config` isn't updated, and the change is retried every `retry_interval` seconds
+        until it succeeds or the file changes again.
+        """
+        self._path = path
+        self._poll_interval = poll_interval
+        self._retry_interval = retry_interval
+        self._retry_time = None
+
+        self._last_mtime = os.stat(path).st_mtime
+        self.config = self._load()
+
+        self._on_change = None
+        self._running = False
+
+    def start(self, on_change: Callable[[dict, dict], None]) -> None:
+        self._on_change = on_change
+        self._running = True
+        Thread(target=self._run_loop, daemon=True).start()
+
+    def stop(self) -> None:
+        self._running = False
+
+    def _load(self) -> dict:
+        with open(self._path, 'r') as file:
+            return yaml.safe_load(file)
+
+    def _run_loop(self) -> None:
+        while self._running:
+            try:
+                mtime = os.stat(self._path).st_mtime
+            except OSError:
+                logger.warning(f'Could not read {self._path}. Keeping the current config.')
+                mtime = self._last_mtime
+
+            retry_due = self._retry_time is not None and time.monotonic() >= self._retry_time
+            if mtime != self._last_mtime or retry_due:
+                self._last_mtime = mtime
+                self._retry_time = None
+                try:
+                    new_config = self._load()
+                    if not isinstance(new_config, dict):
+                        raise ValueError('expected a mapping at the top level')
+                except (OSError, yaml.YAMLError, ValueError):
+                    logger.error(f'Could not load {self._path}. Keeping the current config.', exc_info=True)
+                else:
+                    try:
+                        self._on_change(self.config, new_config)
+                    except Exception:
+                        logger.error(
+                            f'Could not apply changes to {self._path}. Keeping the current config and trying again '
+                            f'in {self._retry_interval:.0f} second(s).',
+                            exc_info=True,
+                            )
+                        self._retry_time = time.monotonic() + self._retry_interval
+                    else:
+                        self.config = new_config
+
+            time.sleep(self._poll_interval)
@@ -0,0 +1,148 @@
+import random
+
+from typing import Iterator
+from model import ROI, BBoxGeometry
+
+class SimulatedObject:
+    def __init__(self, x: float, y: float, size: float) -> None:
+        """
+        An object on the simulated belt. (x, y) is the center of the object in normalized screen units.
+        """
+        self.x = x
+        self.y = y
+        self.size = size
+
+    def is_onscreen(self) -> bool:
+        return self.x + self.size / 2 > 0.0 and self.x - self.size / 2 < 1.0
+
+    def has_exited(self) -> bool:
+        return self.x - self.size / 2 >= 1.0
+
+class ConveyorSimulator:
+    def __init__(self,
+                 belt_speed: float = 0.4,
+                 speed_variation: float = 0.0,
+                 speed_change_interval: float = 5.0,
+                 object_density: float = 0.5,
+                 object_size: float = 0.12,
+                 size_variation: float = 0.0,
+                 dropout_rate: float = 0.0,
+                 position_jitter: float = 0.0,
+                 false_positive_rate: float = 0.0,
+                 inference_fps: float = 5.0,
+                 seed: int = 0) -> None:
+        """
+        Generates a stream of ROIs in the same shape as `ImageQuery.rois`, as if a detector were watching
+        objects move from left to right across a conveyor belt. The ground truth count is known, so the
+        output of the ObjectTracker can be scored.
+
+        belt_speed: nominal belt speed, in normalized screen widths per second
+        speed_variation: every `speed_change_interval` seconds the belt speed changes to a random value within
+            this fraction of the nominal speed, e.g. 0.5 means anywhere from 50% to 150% of `belt_speed`
+        object_density: average number of objects placed on the belt per second
+        object_size: nominal object size, in normalized screen units
+        size_variation: object sizes vary randomly by up to this fraction of `object_size`
+        dropout_rate: probability that the detector misses an object in any given frame
+        position_jitter: standard deviation of the noise added to each bbox coordinate, in normalized screen units
+        false_positive_rate: probability that a spurious detection appears in any given frame
+        inference_fps: how many detector answers are generated per second
+        """
+        self.belt_speed = belt_speed
+        self.speed_variation = speed_variation
+        self.speed_change_interval = speed_change_interval
+        self.object_density = object_density
+        self.object_size = object_size
+        self.size_variation = size_variation
+        self.dropout_rate = dropout_rate
+        self.position_jitter = position_jitter
+        self.false_positive_rate = false_positive_rate
+        self.inference_fps = inference_fps
+
+        self._random = random.Random(seed)
+
+        self.objects: list[SimulatedObject] = []
+        self.ground_truth_count = 0 # number of objects that have crossed the entire belt
+        self.current_speed = belt_speed
+
+    def run(self, duration: float) -> Iterator[tuple[float, list[ROI]]]:
+        """
+        Yields (timestamp, rois) for each frame. New objects are placed on the belt for `duration` seconds,
+        after which the simulation continues until every object has left the belt.
+        """
+        dt = 1.0 / self.inference_fps
+        timestamp = 0.0
+        next_speed_change_time = self.speed_change_interval
+        next_spawn_time = self._next_spawn_interval()
+
+        while timestamp < duration or self.objects:
+            timestamp += dt
+
+            if self.speed_variation > 0 and timestamp >= next_speed_change_time:
+                speed_factor = 1.0 + self._random.uniform(-self.speed_variation, self.speed_variation)
+                self.current_speed = self.belt_speed * max(speed_factor, 0.1) # keep the belt moving so the simulation ends
+                next_speed_change_time += self.speed_change_interval
+
+            # Move existing objects and remove the ones that left the belt
+            remaining_objects = []
+            for obj in self.objects:
+                obj.x += self.current_speed * dt
+                if obj.has_exited():
+                    self.ground_truth_count += 1
+                else:
+                    remaining_objects.append(obj)
+            self.objects = remaining_objects
+
+            # Place new objects just off the left edge of the screen
+            while timestamp < duration and timestamp >= next_spawn_time:
+                size = self.object_size * (1.0 + self._random.uniform(-self.size_variation, self.size_variation))
+                y = self._random.uniform(0.1 + size / 2, 0.9 - size / 2)
+                self.objects.append(SimulatedObject(-size / 2, y, size))
+                next_spawn_time += self._next_spawn_interval()
+
+            yield timestamp, self._detect()
+
+    def _detect(self) -> list[ROI]:
+        rois = []
+        for obj in self.objects:
+            if not obj.is_onscreen() or self._random.random() < self.dropout_rate:
+                continue
+            rois.append(self._make_roi(obj.x, obj.y, obj.size))
+
+        if self._random.random() < self.false_positive_rate:
+            size = self.object_size * self._random.uniform(0.5, 1.5)
+            rois.append(self._make_roi(self._random.uniform(0.0, 1.0), self._random.uniform(0.0, 1.0), size))
+
+        return rois
+
+    def _make_roi(self, x: float, y: float, size: float) -> ROI:
+        half_size = size / 2
+        left, top, right, bottom = (
+            self._jitter(x - half_size),
+            self._jitter(y - half_size),
+            self._jitter(x + half_size),
+            self._jitter(y + half_size),
+            )
+
+        # Like a real detector, only report the visible part of the object
+        left, top = max(left, 0.0), max(top, 0.0)
+        right, bottom = min(right, 1.0), min(bottom, 1.0)
+
+        geometry = BBoxGeometry(
+            left=left,
+            top=top,
+            right=right,
+            bottom=bottom,
+            x=(left + right) / 2,
+            y=(top + bottom) / 2,
+            )
+        return ROI(label='object', score=self._random.uniform(0.6, 1.0), geometry=geometry)
+
+    def _jitter(self, value: float) -> float:
+        if self.position_jitter <= 0:
+            return value
+        return value + self._random.gauss(0.0, self.position_jitter)
+
+    def _next_spawn_interval(self) -> float:
+        # Poisson arrivals, with a minimum gap so that objects don't overlap on the belt
+        min_gap = self.object_size * (1.0 + self.size_variation) / max(self.current_speed, 1e-6)
+        return max(self._random.expovariate(self.object_density), min_gap)
@@ -0,0 +1,204 @@
+"""
+A local stand-in for the Groundlight Edge Endpoint, for benchmarking the app's main loop without a real endpoint.
+
+It implements just enough of the Groundlight API for the app to run: `whoami`, `get_detector` and
+image query submission. Answers come from a simulated conveyor belt, with configurable latency and
+injected errors and hangs.
+
+Usage:
+    python edge_stand_in.py --latency-ms 80 --latency-sigma 0.5 --error-rate 0.05 --hang-rate 0.01
+
+Then point `inference.endpoint` in config.yaml at http://localhost:30101/ (the default). The stand-in
+doesn't check the API token, but the SDK checks its format, so use a dummy token that looks like a real
+one, `api_` followed by 30 or more letters and digits:
+
+    export GROUNDLIGHT_API_TOKEN=api_0000000000000000000000000000000000
+"""
+import argparse
+import logging
+import math
+import random
+import time
+import uuid
+
+from datetime import datetime, timezone
+from flask import Flask, request, jsonify
+
+logger = logging.getLogger(__name__)
+
+class LatencyModel:
+    def __init__(self, distribution: str, latency_ms: float, sigma: float) -> None:
+        """
+        distribution: one of 'constant', 'normal', 'lognormal' or 'exponential'
+        latency_ms: the median latency (mean for 'normal' and 'exponential')
+        sigma: the standard deviation for 'normal' (in ms), or the shape parameter for 'lognormal'
+        """
+        self.distribution = distribution
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+
+    def sample(self) -> float:
+        """Returns a latency in seconds."""
+        if self.distribution == 'constant':
+            latency_ms = self.latency_ms
+        elif self.distribution == 'normal':
+            latency_ms = random.gauss(self.latency_ms, self.sigma)
+        elif self.distribution == 'lognormal':
+            latency_ms = random.lognormvariate(math.log(self.latency_ms), self.sigma)
+        elif self.distribution == 'exponential':
+            latency_ms = random.expovariate(1.0 / self.latency_ms)
+        else:
+            raise ValueError(f'Unexpected latency distribution: {self.distribution}')
+
+        return max(latency_ms, 0.0) / 1000.0
+
+class SimulatedBelt:
+    def __init__(self, belt_speed: float = 0.4, spawn_interval: float = 1.5, object_size: float = 0.12) -> None:
+        """
+        Objects enter on the left and move right at a constant speed. Positions are a pure function of
+        time, so concurrent requests don't need to share any state.
+        """
+        self.belt_speed = belt_speed
+        self.spawn_interval = spawn_interval
+        self.object_size = object_size
+
+    def rois(self, t: float) -> list[dict]:
+        half_size = self.object_size / 2
+        time_onscreen = (1.0 + self.object_size) / self.belt_speed
+
+        rois = []
+        first_idx = math.floor((t - time_onscreen) / self.spawn_interval)
+        last_idx = math.floor(t / self.spawn_interval)
+        for idx in range(first_idx, last_idx + 1):
+            x = -half_size + self.belt_speed * (t - idx * self.spawn_interval)
+            y = 0.3 + 0.4 * random.Random(idx).random()
+            left, right = x - half_size, x + half_size
+            top, bottom = y - half_size, y + half_size
+            if right <= 0.0 or left >= 1.0:
+                continue
+
+            # Objects partially offscreen are clipped to the frame, like a real detector would
+            left, right = max(left, 0.0), min(right, 1.0)
+            rois.append({
+                'label': 'object',
+                'score': 0.9,
+                'geometry': {
+                    'left': left,
+                    'top': top,
+                    'right': right,
+                    'bottom': bottom,
+                    'x': (left + right) / 2,
+                    'y': y,
+                },
+            })
+        return rois
+
+def create_app(latency_model: LatencyModel,
+               belt: SimulatedBelt,
+               error_rate: float = 0.0,
+               hang_rate: float = 0.0,
+               hang_sec: float = 30.0) -> Flask:
+    app = Flask(__name__)
+    start_time = time.monotonic()
+
+    def now_iso() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    @app.route('/device-api/v1/me')
+    def whoami():
+        return jsonify({'email': 'edge-stand-in@example.com', 'username': 'edge-stand-in', 'group': {'id': 1, 'name': 'default'}, 'is_superuser': False})
+
+    @app.route('/device-api/v1/detectors/<detector_id>')
+    def get_detector(detector_id: str):
+        return jsonify({
+            'id': detector_id,
+            'type': 'detector',
+            'created_at': now_iso(),
+            'name': 'edge-stand-in',
+            'query': 'How many objects are on the conveyor belt?',
+            'group_name': 'default',
+            'confidence_threshold': 0.9,
+            'patience_time': 30.0,
+            'metadata': None,
+            'mode': 'COUNT',
+            'mode_configuration': {'class_name': 'object', 'max_count': 10},
+            'status': 'ON',
+            'escalation_type': 'STANDARD',
+        })
+
+    @app.route('/device-api/v1/image-queries', methods=['POST'])
+    def submit_image_query():
+        request.get_data() # read the image so the client isn't blocked on sending it
+
+        roll = random.random()
+        if roll < hang_rate:
+            time.sleep(hang_sec)
+        elif roll < hang_rate + error_rate:
+            time.sleep(latency_model.sample())
+            return jsonify({'detail': 'Injected error'}), 503
+
+        time.sleep(latency_model.sample())
+
+        rois = belt.rois(time.monotonic() - start_time)
+        return jsonify({
+            'metadata': None,
+            'id': f'iq_{uuid.uuid4().hex}',
+            'type': 'image_query',
+            'created_at': now_iso(),
+            'query': 'How many objects are on the conveyor belt?',
+            'detector_id': request.args.get('detector_id'),
+            'result_type': 'counting',
+            'result': {
+                'confidence': 0.9,
+                'source': 'ALGORITHM',
+                'result_type': 'counting',
+                'from_edge': True,
+                'count': len(rois),
+                'greater_than_max': False,
+            },
+            'patience_time': 30.0,
+            'confidence_threshold': 0.9,
+            'rois': rois,
+            'text': None,
+            'done_processing': True,
+        })
+
+    return app
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='A local stand-in for the Groundlight Edge Endpoint')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=30101)
+    parser.add_argument(
+        '--latency-dist',
+        default='lognormal',
+        choices=['constant', 'normal', 'lognormal', 'exponential'],
+        help='The distribution that response latencies are drawn from',
+    )
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='Median (or mean) response latency in milliseconds')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='Spread of the latency distribution')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests that fail with HTTP 503')
+    parser.add_argument('--hang-rate', type=float, default=0.0, help='Fraction of requests that hang for --hang-sec')
+    parser.add_argument('--hang-sec', type=float, default=30.0)
+    parser.add_argument('--belt-speed', type=float, default=0.4, help='Belt speed in normalized screen widths per second')
+    parser.add_argument('--spawn-interval', type=float, default=1.5, help='Seconds between objects')
+
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    app = create_app(
+        LatencyModel(args.latency_dist, args.latency_ms, args.latency_sigma),
+        SimulatedBelt(args.belt_speed, args.spawn_interval),
+        error_rate=args.error_rate,
+        hang_rate=args.hang_rate,
+        hang_sec=args.hang_sec,
+    )
+    logger.info(f'Edge stand-in running at http://{args.host}:{args.port}')
+    app.run(host=args.host, port=args.port, debug=False, use_reloader=False, threaded=True)
+
+if __name__ == '__main__':
+    main()
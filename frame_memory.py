@@ -0,0 +1,189 @@
+import ctypes
+import logging
+import math
+
+from threading import Lock
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+# Consumer priorities. When memory is tight, lower priority consumers are asked to shed first.
+PRIORITY_CAMERA = 100 # the latest frames from the camera, needed by the main loop
+PRIORITY_RESIZE = 80 # frames waiting to be resized
+PRIORITY_VIDEO_WRITER = 50 # frames waiting to be recorded
+PRIORITY_WEB_VIEWER = 20 # the latest JPEG for the web viewer
+PRIORITY_WEB_REQUESTS = 10 # JPEGs being sent to viewers
+
+class Consumer:
+    def __init__(self, name: str, priority: int, shed: Callable[[int], None] | None, max_fraction: float) -> None:
+        self.name = name
+        self.priority = priority
+        self.shed = shed
+        self.max_fraction = max_fraction
+
+        self.bytes_reserved = 0
+        self.peak_bytes_reserved = 0
+        self.num_refused = 0
+        self.num_shed_requests = 0
+
+class FrameMemoryBudget:
+    def __init__(self, budget_bytes: float = math.inf) -> None:
+        """
+        A process-wide budget for memory held by frames in queues and caches.
+
+        Consumers reserve bytes before holding on to a frame and release them when they let go. When a
+        reservation doesn't fit, lower-priority consumers are asked to shed (drop frames and release
+        their reservations) until it does. If it still doesn't fit, the reservation is refused and the
+        consumer is expected to drop the frame instead of holding it.
+
+        By default the budget is unlimited, so reservations always succeed.
+        """
+        self.budget_bytes = budget_bytes
+
+        self._consumers: dict[str, Consumer] = {}
+        self._bytes_reserved = 0
+        self._lock = Lock()
+
+    def register(self,
+                 name: str,
+                 priority: int,
+                 shed: Callable[[int], None] | None = None,
+                 max_fraction: float = 1.0) -> None:
+        """
+        name: a unique name for the consumer
+        priority: consumers with a lower priority shed first
+        shed: called with the number of bytes needed. Should drop frames and release their reservations.
+            Consumers without a shed function are never asked to shed.
+        max_fraction: the most of the budget this consumer can hold. Useful for consumers that can't shed,
+            so that they can't crowd out higher priority consumers.
+        """
+        with self._lock:
+            if name in self._consumers:
+                # e.g. a second video writer. Keep the existing totals, they are shared.
+                self._consumers[name].shed = shed
+            else:
+                self._consumers[name] = Consumer(name, priority, shed, max_fraction)
+
+    def reserve(self, name: str, num_bytes: int) -> bool:
+        """
+        Returns True if the reservation was granted. If not, the caller must not hold on to the frame.
+        """
+        with self._lock:
+            if self._try_reserve(name, num_bytes):
+                return True
+            consumer = self._consumers[name]
+            if consumer.bytes_reserved + num_bytes > consumer.max_fraction * self.budget_bytes:
+                consumer.num_refused += 1
+                return False # shedding others wouldn't help
+            needed = self._bytes_reserved + num_bytes - self.budget_bytes
+            sheddable = sorted(
+                (c for c in self._consumers.values() if c.priority < consumer.priority and c.shed is not None and c.bytes_reserved > 0),
+                key=lambda c: c.priority,
+                )
+
+        # Shed without holding the lock, because shedding consumers call release()
+        for other in sheddable:
+            if needed <= 0:
+                break
+            with self._lock:
+                freed_before = other.bytes_reserved
+                other.num_shed_requests += 1
+            other.shed(needed)
+            needed -= freed_before - other.bytes_reserved
+
+        with self._lock:
+            if self._try_reserve(name, num_bytes):
+                return True
+            self._consumers[name].num_refused += 1
+            return False
+
+    def release(self, name: str, num_bytes: int) -> None:
+        with self._lock:
+            consumer = self._consumers[name]
+            consumer.bytes_reserved -= num_bytes
+            self._bytes_reserved -= num_bytes
+
+    def usage(self) -> dict:
+        """
+        Returns the live byte usage of each consumer.
+        """
+        with self._lock:
+            return {
+                'budget_bytes': None if math.isinf(self.budget_bytes) else self.budget_bytes,
+                'bytes_reserved': self._bytes_reserved,
+                'consumers': {
+                    c.name: {
+                        'priority': c.priority,
+                        'bytes_reserved': c.bytes_reserved,
+                        'peak_bytes_reserved': c.peak_bytes_reserved,
+                        'refused': c.num_refused,
+                        'shed_requests': c.num_shed_requests,
+                    }
+                    for c in self._consumers.values()
+                },
+            }
+
+    def _try_reserve(self, name: str, num_bytes: int) -> bool:
+        consumer = self._consumers[name]
+        if self._bytes_reserved + num_bytes > self.budget_bytes:
+            return False
+        if consumer.bytes_reserved + num_bytes > consumer.max_fraction * self.budget_bytes:
+            return False
+
+        consumer.bytes_reserved += num_bytes
+        consumer.peak_bytes_reserved = max(consumer.peak_bytes_reserved, consumer.bytes_reserved)
+        self._bytes_reserved += num_bytes
+        return True
+
+_budget = FrameMemoryBudget()
+
+def get_budget() -> FrameMemoryBudget:
+    return _budget
+
+def set_budget_bytes(budget_bytes: float) -> None:
+    """
+    Set the process-wide frame memory budget. Should be called at startup, before any frames are captured.
+    """
+    _budget.budget_bytes = budget_bytes
+    logger.info(f'Frame memory budget: {budget_bytes / 2**20:.0f} MiB.')
+
+def apply_config(config: dict) -> None:
+    """
+    Sets up the process-wide budget from the app's config. `frame_memory_budget_mb` is the budget (no cap if
+    it's missing). With a budget, the malloc mmap threshold is pinned unless `pin_malloc_mmap_threshold` is
+    false, since otherwise resident memory can grow past the budget.
+    """
+    budget_mb = config.get('frame_memory_budget_mb')
+    if budget_mb is None:
+        return
+
+    set_budget_bytes(budget_mb * 2**20)
+    if config.get('pin_malloc_mmap_threshold', True):
+        pin_mmap_threshold()
+    else:
+        logger.warning(
+            'pin_malloc_mmap_threshold is off. Frames held by the app stay within the budget, '
+            'but resident memory can grow past it.'
+            )
+
+def pin_mmap_threshold(threshold_bytes: int = 2**20) -> bool:
+    """
+    glibc raises its mmap threshold (up to 32 MiB) each time a large block is freed, after which frames are
+    allocated from the heap, and freed frames can stay resident instead of being returned to the OS. Pinning
+    the threshold keeps each frame in its own mapping, so that resident memory stays within the budget.
+
+    The cost is a fresh mapping (and page faults) for every large allocation, e.g. each frame copy. 
+    Compare with `perf_benchmarks.py --no-pin-mmap-threshold`. Returns False if this isn't glibc.
+    """
+    try:
+        libc = ctypes.CDLL('libc.so.6')
+        M_MMAP_THRESHOLD = -3
+        pinned = libc.mallopt(M_MMAP_THRESHOLD, threshold_bytes) == 1
+    except (OSError, AttributeError):
+        pinned = False
+
+    if pinned:
+        logger.info(f'Pinned the malloc mmap threshold at {threshold_bytes / 2**20:.0f} MiB.')
+    else:
+        logger.warning('Could not pin the malloc mmap threshold. Freed frames may stay resident.')
+    return pinned
@@ -1,20 +1,26 @@
-from flask import Flask, send_file, render_template_string
+from flask import Flask, send_file, render_template_string, request, jsonify
+from typing import Callable
 import threading
 import io
 import cv2
 import logging
 import numpy as np
 
+import frame_memory as fm
+
 class FrameGrabWebServer:
     def __init__(self, 
                  name: str = "FrameGrab Image Viewer", 
                  host:str = "0.0.0.0", 
                  port: int = 5000, 
                  refresh_interval: int = 100, 
-                 width: int = 1280):
+                 width: int = 1280,
+                 start_server: bool = True):
         """
         A simple Flask webserver that can render images in a browser. 
         Useful for viewing video streams from remote devices. 
+        
+        start_server: set to False to use show_image without serving anything, e.g. for benchmarking
         """
         self.name = name
         self.host = host
@@ -22,14 +28,24 @@ class FrameGrabWebServer:
         self.refresh_interval = refresh_interval
         self.width = width
         self.image_bytes = None
+        self._image_lock = threading.Lock()
+        self._last_jpeg_nbytes = None
+        
+        # The latest JPEG and the JPEGs being sent to viewers count against the frame memory budget. 
+        # Responses can't be taken back once they're being sent, so slow viewers are limited to a small share 
+        # of the budget and refused (503) beyond that, rather than allowed to pile up copies of the image.
+        self._budget = fm.get_budget()
+        self._budget.register('web_viewer', fm.PRIORITY_WEB_VIEWER, self._shed)
+        self._budget.register('web_requests', fm.PRIORITY_WEB_REQUESTS, max_fraction=0.1)
         
         logging.getLogger('werkzeug').setLevel(logging.ERROR)
 
         self.app = Flask(__name__)
         self._setup_routes()
 
-        threading.Thread(target=self._run, daemon=True).start()
-        print(f"FrameGrab web server running at http://{self.host}:{self.port}")
+        if start_server:
+            threading.Thread(target=self._run, daemon=True).start()
+            print(f"FrameGrab web server running at http://{self.host}:{self.port}")
 
     def _setup_routes(self) -> None:
         TEMPLATE = f'''
@@ -53,13 +69,60 @@ class FrameGrabWebServer:
 
         @self.app.route('/image')
         def image():
-            if self.image_bytes is None:
+            image_bytes = self.image_bytes
+            if image_bytes is None:
                 return 'No image available', 404
-            return send_file(io.BytesIO(self.image_bytes), mimetype='image/jpeg')
+            
+            num_bytes = len(image_bytes)
+            if not self._budget.reserve('web_requests', num_bytes):
+                return 'Frame memory budget exceeded', 503
+            response = send_file(io.BytesIO(image_bytes), mimetype='image/jpeg')
+            response.call_on_close(lambda: self._budget.release('web_requests', num_bytes))
+            return response
+
+    def register_json_endpoint(self, rule: str, handler: Callable[[dict], object]) -> None:
+        """
+        Serve the result of `handler` as JSON at `rule`. The handler is called with the request's query
+        parameters. If it raises a ValueError, the error message is returned with a 400 status.
+        """
+        def endpoint():
+            try:
+                return jsonify(handler(request.args.to_dict()))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            
+        self.app.add_url_rule(rule, endpoint=rule, view_func=endpoint)
 
     def _run(self) -> None:
         self.app.run(host=self.host, port=self.port, debug=False, use_reloader=False)
 
     def show_image(self, frame: np.ndarray) -> None:
+        # Encoding needs room for the JPEG and a copy of it. Until the first image is encoded, assume that the JPEG 
+        # is at most a quarter of the size of the frame. If there isn't room, keep showing the previous image.
+        jpeg_nbytes = frame.nbytes // 4 if self._last_jpeg_nbytes is None else self._last_jpeg_nbytes
+        encode_nbytes = 2 * jpeg_nbytes
+        if not self._budget.reserve('web_viewer', encode_nbytes):
+            return
+        
         _, jpeg = cv2.imencode('.jpg', frame)
-        self.image_bytes = jpeg.tobytes()
\ No newline at end of file
+        image_bytes = jpeg.tobytes()
+        del jpeg
+        self._last_jpeg_nbytes = len(image_bytes)
+        
+        # Keep only the new image's bytes reserved
+        if len(image_bytes) <= encode_nbytes:
+            self._budget.release('web_viewer', encode_nbytes - len(image_bytes))
+        else:
+            self._budget.release('web_viewer', encode_nbytes)
+            if not self._budget.reserve('web_viewer', len(image_bytes)):
+                return
+        with self._image_lock:
+            previous_image_bytes, self.image_bytes = self.image_bytes, image_bytes
+        if previous_image_bytes is not None:
+            self._budget.release('web_viewer', len(previous_image_bytes))
+            
+    def _shed(self, num_bytes: int) -> None:
+        with self._image_lock:
+            previous_image_bytes, self.image_bytes = self.image_bytes, None
+        if previous_image_bytes is not None:
+            self._budget.release('web_viewer', len(previous_image_bytes))
\ No newline at end of file
@@ -59,3 +59,8 @@ def resize(frame: np.ndarray, max_width: int = None, max_height: int = None) ->
     resized_frame = cv2.resize(frame, dim, interpolation=cv2.INTER_AREA)
     return resized_frame
 
+def encode_jpeg(frame: np.ndarray, quality: int = 95) -> bytes:
+    success, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not success:
+        raise ValueError('Failed to encode frame as JPEG.')
+    return jpeg.tobytes()
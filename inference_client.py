@@ -0,0 +1,267 @@
+import logging
+import time
+
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from threading import Lock, Thread
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+def create_groundlight_client(endpoint: str, sdk_retries: bool = True):
+    """
+    Creates a Groundlight client. The client's underlying urllib3 pool keeps connections to the endpoint
+    alive, so requests don't pay for a new TCP handshake each frame. urllib3's own retries are disabled.
+
+    The SDK itself retries requests that fail with a 5xx status, up to 3 times with up to about a second of
+    backoff. Each retry is a new request, and a new image query if it's a submission. With `sdk_retries=False`
+    every call sends exactly one request, which is what per-frame inference needs: retrying is the job of the
+    InferenceClient, which knows how much time is left in the frame.
+    """
+    import groundlight
+    from groundlight.internalapi import GroundlightApiClient
+
+    gl = groundlight.ExperimentalApi(endpoint=endpoint, http_transport_retries=0)
+    if not sdk_retries:
+        # GroundlightApiClient.call_api is wrapped in the SDK's RequestsRetryDecorator, call the undecorated method instead
+        gl.api_client.call_api = GroundlightApiClient.call_api.__wrapped__.__get__(gl.api_client)
+    return gl
+
+def ask_ml_within(gl, detector, image: object, timeout: float) -> object:
+    """
+    Like `gl.ask_ml`, but the HTTP request itself times out after `timeout` seconds. (`ask_ml`'s `wait` only
+    limits how long the SDK polls for an answer, and each of its requests can take up to the SDK's default
+    timeout.) Pass a client created with `sdk_retries=False`, otherwise a failed submission is retried in the
+    background after the caller has given up on it.
+
+    The answer has to come back with the submission, as it does from an edge endpoint. There's no time
+    left in a frame to poll for it, so a submission that comes back unanswered raises a TimeoutError.
+    """
+    from groundlight.internalapi import iq_is_answered
+
+    iq = gl.submit_image_query(detector, image, wait=0, request_timeout=timeout)
+    if not iq_is_answered(iq):
+        raise TimeoutError(f'{iq.id} was not answered with the submission')
+    return iq
+
+class CircuitBreaker:
+    CLOSED = 'CLOSED'
+    OPEN = 'OPEN'
+    HALF_OPEN = 'HALF_OPEN'
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 5.0) -> None:
+        """
+        Stops sending requests to an unhealthy endpoint.
+
+        After `failure_threshold` consecutive failures the breaker opens and all requests are refused
+        for `reset_timeout` seconds. After that, a single probe request is allowed through (half-open).
+        If it succeeds the breaker closes, otherwise it opens again.
+        """
+        self.FAILURE_THRESHOLD = failure_threshold
+        self.RESET_TIMEOUT = reset_timeout
+
+        self.state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_time = 0.0
+        self._probe_in_flight = False
+
+        self._lock = Lock()
+
+    def set_thresholds(self, failure_threshold: int, reset_timeout: float) -> None:
+        with self._lock:
+            self.FAILURE_THRESHOLD = failure_threshold
+            self.RESET_TIMEOUT = reset_timeout
+
+    def allow_request(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN and time.monotonic() - self._opened_time >= self.RESET_TIMEOUT:
+                self.state = self.HALF_OPEN
+                logger.info('Circuit breaker half-open. Probing the inference endpoint.')
+
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                self.state = self.CLOSED
+                logger.info('Circuit breaker closed. Inference endpoint is healthy again.')
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self._consecutive_failures >= self.FAILURE_THRESHOLD:
+                if self.state != self.OPEN:
+                    logger.error(
+                        f'Circuit breaker open after {self._consecutive_failures} consecutive failure(s). '
+                        f'Falling back to tracker-only predictions for {self.RESET_TIMEOUT:.1f} second(s).'
+                        )
+                self.state = self.OPEN
+                self._opened_time = time.monotonic()
+
+class InferenceClient:
+    # Outcomes of a call to `ask`
+    ANSWERED = 'ANSWERED'
+    REJECTED = 'REJECTED' # never sent: the circuit breaker is open, too many requests are in flight, or the client is shut down
+    TIMED_OUT = 'TIMED_OUT'
+    FAILED = 'FAILED'
+
+    def __init__(self,
+                 infer: Callable[[object, float], object],
+                 deadline: float,
+                 hedge_after: float | None = None,
+                 max_in_flight: int = 4,
+                 failure_threshold: int = 3,
+                 reset_timeout: float = 5.0) -> None:
+        """
+        Runs inference requests with a per-request deadline so that a slow or failed request can't stall
+        the main loop.
+
+        infer: performs a single request, e.g. `lambda image, timeout: ask_ml_within(gl, detector, image, timeout)`.
+            The request itself should give up after `timeout` seconds without retrying, so that abandoned
+            requests don't pile up.
+        deadline: the maximum amount of time to wait for an answer, in seconds. Usually a fraction of the frame period.
+        hedge_after: if set, a second (hedged) request is sent when the first hasn't answered after this many
+            seconds, and whichever answers first is used. Only use this if it's safe to send a request twice:
+            each Groundlight request creates a new image query, so a hedged frame is submitted twice.
+        max_in_flight: the maximum number of outstanding requests, including ones that were abandoned
+            after their deadline passed.
+
+        Requests run on daemon threads, so abandoned requests never keep the process alive at exit.
+        """
+        self._infer = infer
+        self.deadline = deadline
+        self.hedge_after = hedge_after
+        self.max_in_flight = max_in_flight
+
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self._in_flight_lock = Lock()
+        self._num_in_flight = 0
+        self._running = True
+
+        self._stats_lock = Lock()
+        self._stats = {
+            'successes': 0,
+            'timeouts': 0,
+            'errors': 0,
+            'rejected': 0,
+            'hedges': 0,
+            'hedge_wins': 0,
+        }
+
+    def ask(self, image: object) -> tuple[object | None, str]:
+        """
+        Returns the answer from the endpoint (or None if there isn't one) and the outcome, one of ANSWERED,
+        REJECTED, TIMED_OUT or FAILED.
+        """
+        if not self._running or not self.breaker.allow_request():
+            self._increment('rejected')
+            return None, self.REJECTED
+
+        start_time = time.monotonic()
+        deadline_time = start_time + self.deadline
+
+        primary = self._submit(image)
+        if primary is None:
+            logger.warning('Too many inference requests in flight. Skipping inference for this frame.')
+            self._increment('rejected')
+            self.breaker.record_failure()
+            return None, self.REJECTED
+
+        pending = {primary}
+
+        if self.hedge_after is not None and self.hedge_after < self.deadline:
+            done, _ = wait(pending, timeout=self.hedge_after)
+            if not done or primary.exception() is not None:
+                hedge = self._submit(image)
+                if hedge is not None:
+                    self._increment('hedges')
+                    pending.add(hedge)
+
+        result = None
+        last_exception = None
+        while pending and result is None:
+            remaining_time = deadline_time - time.monotonic()
+            if remaining_time <= 0:
+                break
+
+            done, pending = wait(pending, timeout=remaining_time, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    result = future.result()
+                    if future is not primary:
+                        self._increment('hedge_wins')
+                    break
+                last_exception = future.exception()
+
+        if result is not None:
+            self._increment('successes')
+            self.breaker.record_success()
+            return result, self.ANSWERED
+
+        if pending:
+            outcome = self.TIMED_OUT
+            self._increment('timeouts')
+            logger.warning(f'Inference request did not complete within the deadline of {self.deadline:.3f} second(s).')
+        else:
+            outcome = self.FAILED
+            self._increment('errors')
+            logger.warning(f'Inference request failed: {last_exception!r}')
+        self.breaker.record_failure()
+        return None, outcome
+
+    def set_limits(self, max_in_flight: int, failure_threshold: int, reset_timeout: float) -> None:
+        """
+        Change the in-flight cap and circuit breaker settings while running. Requests already in flight are kept.
+        """
+        self.max_in_flight = max_in_flight
+        self.breaker.set_thresholds(failure_threshold, reset_timeout)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return {**self._stats, 'breaker_state': self.breaker.state, 'in_flight': self._num_in_flight}
+
+    def shutdown(self) -> None:
+        """
+        Stop sending requests. Requests still in flight are abandoned.
+        """
+        self._running = False
+        if self._num_in_flight > 0:
+            logger.info(f'Abandoning {self._num_in_flight} inference request(s) in flight.')
+
+    def _submit(self, image: object) -> Future | None:
+        # Abandoned requests keep running in the background until they time out, so cap the number of 
+        # outstanding requests rather than letting them pile up behind a stalled endpoint
+        with self._in_flight_lock:
+            if self._num_in_flight >= self.max_in_flight:
+                return None
+            self._num_in_flight += 1
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+        timeout = self.deadline
+
+        def run() -> None:
+            try:
+                future.set_result(self._infer(image, timeout))
+            except Exception as e:
+                future.set_exception(e)
+            finally:
+                with self._in_flight_lock:
+                    self._num_in_flight -= 1
+
+        Thread(target=run, daemon=True, name='inference').start()
+        return future
+
+    def _increment(self, key: str) -> None:
+        with self._stats_lock:
+            self._stats[key] += 1
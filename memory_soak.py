@@ -0,0 +1,233 @@
+"""
+Soak test for the frame memory budget.
+
+Streams synthetic 4K frames through the camera, video writer and web server at full speed, with a
+deliberately stalled video writer and viewers that request images but never read them, and checks
+that the process's peak resident memory grows by no more than the frame memory budget. No camera,
+detector or network is needed.
+
+The budget and the malloc mmap threshold are set up from config.yaml, as in the app, so by default
+this tests what ships. --budget-mb and --[no-]pin-mmap-threshold override the config. Without
+pinning, glibc can keep freed frames resident, so expect the test to fail.
+
+Usage:
+    python memory_soak.py
+    python memory_soak.py --budget-mb 256 --duration 300 --viewers 50
+"""
+import argparse
+import logging
+import os
+import resource
+import socket
+import tempfile
+import time
+
+from threading import Thread
+
+import cv2
+import numpy as np
+import yaml
+
+import camera as cam
+import frame_memory as fm
+from framegrab_web_server import FrameGrabWebServer
+from synthetic_frames import RESOLUTIONS, synthetic_frame
+from timing import LoopManager
+
+logger = logging.getLogger(__name__)
+
+class SyntheticCamera:
+    """
+    Stands in for a framegrab.FrameGrabber. Each grab returns a new copy of the frame, like a real camera.
+    """
+    class Capture:
+        def __init__(self) -> None:
+            self._props = {}
+
+        def set(self, prop: int, value: float) -> bool:
+            self._props[prop] = value
+            return True
+
+        def get(self, prop: int) -> float:
+            return self._props.get(prop, 0.0)
+
+    class Config:
+        name = 'synthetic camera'
+
+    def __init__(self, frame: np.ndarray) -> None:
+        self.frame = frame
+        self.capture = self.Capture()
+        self.config = self.Config()
+
+    def grab(self) -> np.ndarray:
+        return self.frame.copy()
+
+    def release(self) -> None:
+        pass
+
+class StalledVideoWriter:
+    """
+    Stands in for a cv2.VideoWriter on a slow disk.
+    """
+    def __init__(self, delay: float) -> None:
+        self.delay = delay
+
+    def write(self, frame: np.ndarray) -> None:
+        time.sleep(self.delay)
+
+    def release(self) -> None:
+        pass
+
+def open_stalled_viewer(port: int) -> socket.socket:
+    """
+    Requests an image from the web server and never reads the response, so the server blocks while sending it.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.connect(('127.0.0.1', port))
+    sock.sendall(b'GET /image HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    return sock
+
+def current_rss_bytes() -> int:
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # Not Linux. ru_maxrss is the peak so far, which is in kilobytes on Linux but bytes on macOS.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+class RSSMonitor:
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self.peak_bytes = current_rss_bytes()
+        self._running = True
+        self._thread = Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+        self._thread.join()
+
+    def _run_loop(self) -> None:
+        while self._running:
+            self.peak_bytes = max(self.peak_bytes, current_rss_bytes())
+            time.sleep(self.interval)
+
+def log_usage(usage: dict) -> None:
+    logger.info(f'Frame memory reserved: {usage["bytes_reserved"] / 2**20:.1f} MiB')
+    for name, consumer in usage['consumers'].items():
+        logger.info(
+            f'  {name:<14} {consumer["bytes_reserved"] / 2**20:7.1f} MiB '
+            f'(peak {consumer["peak_bytes_reserved"] / 2**20:7.1f} MiB) | '
+            f'refused: {consumer["refused"]} | shed requests: {consumer["shed_requests"]}'
+            )
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Check that peak memory stays within the frame memory budget under load')
+    parser.add_argument('--config', default='config.yaml', help='The app config to take the budget and mmap pinning from')
+    parser.add_argument('--budget-mb', type=float, help='The frame memory budget, in MiB (default: frame_memory_budget_mb from the config)')
+    parser.add_argument(
+        '--pin-mmap-threshold',
+        action=argparse.BooleanOptionalAction,
+        help='Pin the malloc mmap threshold (default: pin_malloc_mmap_threshold from the config)',
+    )
+    parser.add_argument('--resolution', default='4k', choices=list(RESOLUTIONS))
+    parser.add_argument('--duration', type=float, default=60.0, help='Seconds to run for')
+    parser.add_argument('--camera-fps', type=float, default=30.0)
+    parser.add_argument('--fps', type=float, default=10.0, help='Main loop frames per second')
+    parser.add_argument('--writer-delay', type=float, default=1.0, help='Seconds the stalled video writer takes per frame')
+    parser.add_argument('--viewers', type=int, default=50, help='Number of stalled viewers')
+    parser.add_argument('--port', type=int, default=5055, help='Port for the web server')
+
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    # Dropped frames and slow loops are expected, don't flood the output
+    logging.getLogger('camera').setLevel(logging.CRITICAL)
+    logging.getLogger('timing').setLevel(logging.CRITICAL)
+
+    with open(args.config, 'r') as file:
+        config = yaml.safe_load(file) or {}
+    if args.budget_mb is not None:
+        config['frame_memory_budget_mb'] = args.budget_mb
+    if args.pin_mmap_threshold is not None:
+        config['pin_malloc_mmap_threshold'] = args.pin_mmap_threshold
+    if config.get('frame_memory_budget_mb') is None:
+        logger.error(f'No frame_memory_budget_mb in {args.config}. Pass --budget-mb. Exiting.')
+        exit(1)
+
+    fm.apply_config(config)
+    budget_bytes = fm.get_budget().budget_bytes
+
+    width, height = RESOLUTIONS[args.resolution]
+    frame = synthetic_frame(width, height)
+
+    web_server = FrameGrabWebServer('Memory Soak', host='127.0.0.1', port=args.port)
+    video_output_dir = tempfile.TemporaryDirectory()
+    video_writer = cam.ThreadedVideoWriter('memory_soak', (width, height), args.fps, directory=video_output_dir.name)
+    video_writer.writer.release()
+    video_writer.writer = StalledVideoWriter(args.writer_delay)
+    time.sleep(1.0) # let the web server start
+
+    # Everything from here on should be covered by the budget
+    baseline_bytes = current_rss_bytes()
+    monitor = RSSMonitor()
+
+    grabber = cam.ThreadedFrameGrabber(SyntheticCamera(frame), args.camera_fps)
+    if not grabber.wait_for_first_frame(timeout=5.0):
+        logger.error('No frames from the synthetic camera. Exiting.')
+        exit(1)
+
+    viewers = []
+    main_loop_manager = LoopManager('Main Loop', 1 / args.fps)
+    start_time = time.perf_counter()
+    last_report_time = start_time
+    while time.perf_counter() - start_time < args.duration:
+        main_loop_manager.start()
+
+        frames, timestamp = grabber.grab()
+        annotated_frame = frames['annotated']
+        cv2.putText(annotated_frame, f'{timestamp:.3f}', (50, 100), cv2.FONT_HERSHEY_SIMPLEX, 3, (0, 0, 255), 5)
+        video_writer.add_frame(annotated_frame)
+        web_server.show_image(annotated_frame)
+
+        # Add the stalled viewers gradually, so they pile up while everything else is running
+        if len(viewers) < args.viewers:
+            try:
+                viewers.append(open_stalled_viewer(args.port))
+            except OSError:
+                logger.warning('Could not connect a stalled viewer.', exc_info=True)
+
+        if time.perf_counter() - last_report_time > 10.0:
+            last_report_time = time.perf_counter()
+            logger.info(
+                f'{last_report_time - start_time:.0f}s | RSS: {(current_rss_bytes() - baseline_bytes) / 2**20:.1f} MiB '
+                f'above baseline (peak {(monitor.peak_bytes - baseline_bytes) / 2**20:.1f} MiB)'
+                )
+
+        main_loop_manager.wait()
+
+    monitor.stop()
+    usage = fm.get_budget().usage()
+
+    grabber.release()
+    time.sleep(1.0) # let in-flight resizes finish, so the interpreter doesn't exit in the middle of one
+    for viewer in viewers:
+        viewer.close()
+    video_writer.writer.delay = 0.0
+    video_writer.stop()
+    video_output_dir.cleanup()
+
+    peak_growth_bytes = monitor.peak_bytes - baseline_bytes
+    logger.info('')
+    log_usage(usage)
+    logger.info(f'\nPeak RSS: {peak_growth_bytes / 2**20:.1f} MiB above baseline | budget: {budget_bytes / 2**20:.1f} MiB')
+
+    if peak_growth_bytes > budget_bytes:
+        logger.error(f'Peak RSS exceeded the frame memory budget by {(peak_growth_bytes - budget_bytes) / 2**20:.1f} MiB.')
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,8 @@
 import math
-from model import ROI
+from model import ROI, ImageQuery # groundlight's models, without importing the rest of the SDK
 import cv2
 import numpy as np
-from groundlight import ImageQuery
+from throughput import ThroughputRollups
 
 def is_fully_onscreen(bbox) -> bool:
     
@@ -125,9 +125,24 @@ class TrackedObject:
         
 class ObjectTracker:
     counter = 0 # counts the instances of unique objects the Object Tracker has seen.
-    def __init__(self, expected_x_velocity: float = 0.0, expected_y_velocity: float = 0.0) -> None:
+    
+    # The settings that set_thresholds accepts, i.e. the `tracker` section of config.yaml
+    THRESHOLD_NAMES = (
+        'expected_x_velocity',
+        'expected_y_velocity',
+        'distance_matching_thresh',
+        'max_time_since_last_seen',
+        'min_distance_traveled_thresh',
+    )
+    
+    def __init__(self, 
+                 expected_x_velocity: float = 0.0, 
+                 expected_y_velocity: float = 0.0, 
+                 throughput: ThroughputRollups | None = None) -> None:
         """
         Tracks objects across frames
+        
+        throughput: if provided, counts, object velocities and idle time are fed into these rollups
         """
         self.EXPECTED_X_VELOCITY = expected_x_velocity
         self.EXPECTED_Y_VELOCITY = expected_y_velocity
@@ -137,10 +152,54 @@ class ObjectTracker:
         self.DISTANCE_MATCHING_THRESH = 0.1 # normalized screen units
         self.MAX_TIME_SINCE_LAST_SEEN = 0.5 
         
+        self.MIN_MOVING_VELOCITY = 0.02 # normalized screen units per second. Slower objects are considered stationary.
+        
         self.tracked_objects = []
         
         self.object_count = 0
         
+        self.throughput = throughput
+        
+    def set_thresholds(self,
+                       expected_x_velocity: float | None = None,
+                       expected_y_velocity: float | None = None,
+                       distance_matching_thresh: float | None = None,
+                       max_time_since_last_seen: float | None = None,
+                       min_distance_traveled_thresh: float | None = None) -> None:
+        """
+        Update the tracker's settings in place, e.g. after the config file changes. Tracked objects and the
+        object count are kept. Settings that are None are left unchanged.
+        """
+        if expected_x_velocity is not None:
+            self.EXPECTED_X_VELOCITY = expected_x_velocity
+        if expected_y_velocity is not None:
+            self.EXPECTED_Y_VELOCITY = expected_y_velocity
+        if distance_matching_thresh is not None:
+            self.DISTANCE_MATCHING_THRESH = distance_matching_thresh
+        if max_time_since_last_seen is not None:
+            self.MAX_TIME_SINCE_LAST_SEEN = max_time_since_last_seen
+        if min_distance_traveled_thresh is not None:
+            self.MIN_DISTANCE_TRAVELED_THRESH = min_distance_traveled_thresh
+            
+        for tracked_object in self.tracked_objects:
+            tracked_object.EXPECTED_X_VELOCITY = self.EXPECTED_X_VELOCITY
+            tracked_object.EXPECTED_Y_VELOCITY = self.EXPECTED_Y_VELOCITY
+            
+    @classmethod
+    def check_thresholds(cls, thresholds: dict) -> None:
+        """
+        Raises a ValueError if `thresholds` has settings that set_thresholds doesn't accept, or values that
+        aren't numbers, so that a config change can be checked before any of it is applied.
+        """
+        unknown_names = [str(name) for name in thresholds if name not in cls.THRESHOLD_NAMES]
+        if unknown_names:
+            raise ValueError(
+                f'Unknown tracker setting(s): {", ".join(unknown_names)}. Expected: {", ".join(cls.THRESHOLD_NAMES)}'
+            )
+        for name, value in thresholds.items():
+            if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                raise ValueError(f'Tracker setting {name} must be a number, got {value!r}')
+        
     def add_rois(self, rois: list[ROI], timestamp: float) -> None:
         """
         Incorporate a list of detected ROIs into the tracker for the current frame.
@@ -201,6 +260,31 @@ class ObjectTracker:
             if time_since_last_seen > self.MAX_TIME_SINCE_LAST_SEEN:
                 tracked_object.mark_for_purging()
     
+    def moving_velocities(self) -> list[float]:
+        """
+        Returns the velocities of the objects seen moving in the most recent frame.
+        """
+        velocities = []
+        for tracked_object in self.tracked_objects:
+            if tracked_object.is_missing:
+                continue
+            velocity = tracked_object.get_velocity()
+            if velocity is not None and velocity > self.MIN_MOVING_VELOCITY:
+                velocities.append(velocity)
+        return velocities
+    
+    def observed_bbox_sizes(self) -> list[tuple[float, float]]:
+        """
+        Returns the normalized (width, height) of each object seen in the most recent frame.
+        """
+        sizes = []
+        for tracked_object in self.tracked_objects:
+            if tracked_object.is_missing:
+                continue
+            bbox = tracked_object.current_roi().geometry
+            sizes.append((bbox.right - bbox.left, bbox.bottom - bbox.top))
+        return sizes
+    
     def purge_missing_objects(self) -> None:
         """
         Remove tracked objects that have been marked for purging and update the object count.
@@ -229,17 +313,12 @@ class ObjectTracker:
                 
                 if distance_traveled > self.MIN_DISTANCE_TRAVELED_THRESH:
                     self.object_count += 1
+                    if self.throughput is not None:
+                        self.throughput.record_count()
                 
         self.tracked_objects = tracked_objects
         
-    def annotate_frame(self, frame: np.ndarray) -> None:
-        """
-        Draw bounding boxes around currently tracked objects onto the frame.
-        Assumes bbox has normalized coordinates (left, top, right, bottom in 0.0–1.0).
-        """
-        height, width = frame.shape[:2]
-        thickness = 2
-        
+    def _annotate_count(self, frame: np.ndarray) -> None:
         # Draw a solid white rectangle under the text, make it the same size as the text, but with a little margin
         text = f'Object count: {self.object_count}'
         font = cv2.FONT_HERSHEY_SIMPLEX
@@ -250,6 +329,16 @@ class ObjectTracker:
         x, y = org
         cv2.rectangle(frame, (x - margin, y - size[1] - margin), (x + size[0] + margin, y + baseline + margin), (255, 255, 255), -1)
         cv2.putText(frame, text, org, font, scale, (0, 255, 0), thickness)
+        
+    def annotate_frame(self, frame: np.ndarray) -> None:
+        """
+        Draw bounding boxes around currently tracked objects onto the frame.
+        Assumes bbox has normalized coordinates (left, top, right, bottom in 0.0–1.0).
+        """
+        height, width = frame.shape[:2]
+        thickness = 2
+        
+        self._annotate_count(frame)
 
         for tracked_object in self.tracked_objects:
             
@@ -298,8 +387,47 @@ class ObjectTracker:
             label = f"ID: {tracked_object.idx} | velocity: {velocity_str}"
             cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
             
+    def annotate_predictions(self, frame: np.ndarray, timestamp: float) -> None:
+        """
+        Draw each tracked object's bounding box at its estimated position for the given timestamp.
+        Used when no detections are available for the current frame.
+        """
+        height, width = frame.shape[:2]
+        color = (0, 255, 255)
+        
+        self._annotate_count(frame)
+        
+        for tracked_object in self.tracked_objects:
+            estimated_next_pos = tracked_object.estimate_next_position(timestamp)
+            if estimated_next_pos is None:
+                continue
+            
+            bbox = tracked_object.current_roi().geometry
+            dx = estimated_next_pos[0] - bbox.x
+            dy = estimated_next_pos[1] - bbox.y
+            
+            x1 = int((bbox.left + dx) * width)
+            y1 = int((bbox.top + dy) * height)
+            x2 = int((bbox.right + dx) * width)
+            y2 = int((bbox.bottom + dy) * height)
+            
+            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 1)
+            label = f"ID: {tracked_object.idx} | predicted"
+            cv2.putText(frame, label, (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+            
+    def predict(self, timestamp: float, annotated_frame: np.ndarray) -> None:
+        """
+        Tracker-only fallback for frames without detections, e.g. while the inference endpoint is unhealthy.
+        
+        Tracked objects are neither updated nor purged, so they can be matched again (using their
+        estimated positions) once detections resume.
+        """
+        self.annotate_predictions(annotated_frame, timestamp)
+            
     def run(self, iq: ImageQuery, timestamp: float, annotated_frame: np.ndarray) -> None:
         rois = [] if iq.rois is None else iq.rois
         self.add_rois(rois, timestamp)
+        if self.throughput is not None:
+            self.throughput.record_frame(self.moving_velocities())
         self.annotate_frame(annotated_frame)
         self.purge_missing_objects()
\ No newline at end of file
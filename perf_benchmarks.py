@@ -0,0 +1,270 @@
+"""
+Micro-benchmarks for the per-frame hot paths, with performance budgets.
+
+Each benchmark runs on synthetic frames and simulated detections, so no camera, detector or network
+is needed. Results are appended to a machine-readable history file (one JSON object per line), and
+the run fails if any path exceeds its time or allocation budget for the selected hardware profile.
+
+Usage:
+    python perf_benchmarks.py
+    python perf_benchmarks.py --profile default --repeat 100
+    python perf_benchmarks.py --only resize --only show_image
+    python perf_benchmarks.py --pin-mmap-threshold --only 4k
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from typing import Callable, Iterator
+
+import cv2
+import numpy as np
+import yaml
+
+import camera as cam
+import frame_memory as fm
+import image_utils as iu
+import object_tracking as ot
+from conveyor_simulator import ConveyorSimulator
+from framegrab_web_server import FrameGrabWebServer
+from synthetic_frames import RESOLUTIONS, synthetic_frame
+
+logger = logging.getLogger(__name__)
+
+def simulated_detections(num_frames: int) -> list[tuple[float, list]]:
+    fps = 5.0
+    simulator = ConveyorSimulator(
+        object_density=2.0,
+        size_variation=0.3,
+        dropout_rate=0.1,
+        position_jitter=0.005,
+        false_positive_rate=0.1,
+        inference_fps=fps,
+        )
+    frames = []
+    for frame in simulator.run(duration=num_frames / fps + 10.0):
+        frames.append(frame)
+        if len(frames) == num_frames:
+            break
+    return frames
+
+# Each benchmark yields one zero-argument callable per iteration. Only the callables are timed,
+# so any per-iteration setup happens in the generator between yields.
+
+def bench_resize(resolution: str, num_iterations: int) -> Iterator[Callable]:
+    frame = synthetic_frame(*RESOLUTIONS[resolution])
+    for _ in range(num_iterations):
+        yield lambda: iu.resize(frame, max_width=200)
+
+def bench_frame_copy(resolution: str, num_iterations: int) -> Iterator[Callable]:
+    frame = synthetic_frame(*RESOLUTIONS[resolution])
+    for _ in range(num_iterations):
+        yield frame.copy
+
+def bench_show_image(resolution: str, num_iterations: int) -> Iterator[Callable]:
+    frame = synthetic_frame(*RESOLUTIONS[resolution])
+    web_server = FrameGrabWebServer(start_server=False)
+    for _ in range(num_iterations):
+        yield lambda: web_server.show_image(frame)
+
+def bench_tracker_add_rois(num_iterations: int) -> Iterator[Callable]:
+    tracker = ot.ObjectTracker(0.4, 0.0)
+    for timestamp, rois in simulated_detections(num_iterations):
+        yield lambda: tracker.add_rois(rois, timestamp)
+        tracker.purge_missing_objects()
+
+def bench_tracker_purge_missing_objects(num_iterations: int) -> Iterator[Callable]:
+    tracker = ot.ObjectTracker(0.4, 0.0)
+    for timestamp, rois in simulated_detections(num_iterations):
+        tracker.add_rois(rois, timestamp)
+        yield tracker.purge_missing_objects
+
+def bench_tracker_annotate_frame(resolution: str, num_iterations: int) -> Iterator[Callable]:
+    frame = synthetic_frame(*RESOLUTIONS[resolution])
+    tracker = ot.ObjectTracker(0.4, 0.0)
+    for timestamp, rois in simulated_detections(num_iterations):
+        tracker.add_rois(rois, timestamp)
+        yield lambda: tracker.annotate_frame(frame)
+        tracker.purge_missing_objects()
+
+def bench_video_writer(resolution: str, num_iterations: int) -> Iterator[Callable]:
+    """
+    Once the writer's queue is full, each call waits for the writer thread to make room,
+    so the time per call is the writer's steady-state time per frame.
+    """
+    width, height = RESOLUTIONS[resolution]
+    frame = synthetic_frame(width, height)
+
+    def add_frame() -> None:
+        while video_writer.queue.full():
+            time.sleep(0.0005)
+        video_writer.add_frame(frame)
+
+    with tempfile.TemporaryDirectory() as directory:
+        video_writer = cam.ThreadedVideoWriter('benchmark', (width, height), 30, directory=directory)
+        try:
+            for _ in range(num_iterations):
+                yield add_frame
+        finally:
+            video_writer.stop()
+
+BENCHMARKS: dict[str, tuple[Callable[[int], Iterator[Callable]], int]] = {
+    # name: (benchmark, number of warmup iterations)
+    'resize_1080p': (lambda n: bench_resize('1080p', n), 3),
+    'resize_4k': (lambda n: bench_resize('4k', n), 3),
+    'frame_copy_1080p': (lambda n: bench_frame_copy('1080p', n), 3),
+    'frame_copy_4k': (lambda n: bench_frame_copy('4k', n), 3),
+    'tracker_add_rois': (bench_tracker_add_rois, 10),
+    'tracker_purge_missing_objects': (bench_tracker_purge_missing_objects, 10),
+    'tracker_annotate_frame_1080p': (lambda n: bench_tracker_annotate_frame('1080p', n), 10),
+    'show_image_1080p': (lambda n: bench_show_image('1080p', n), 3),
+    'show_image_4k': (lambda n: bench_show_image('4k', n), 3),
+    'video_writer_1080p': (lambda n: bench_video_writer('1080p', n), 15), # enough warmup to fill the writer's queue
+}
+
+def run_benchmark(benchmark: Callable[[int], Iterator[Callable]], warmup: int, repeat: int) -> dict:
+    # Time and allocations are measured in separate passes, because tracing allocations slows everything down
+    times_ms = []
+    for i, fn in enumerate(benchmark(warmup + repeat)):
+        start_time = time.perf_counter()
+        fn()
+        elapsed_time = time.perf_counter() - start_time
+        if i >= warmup:
+            times_ms.append(elapsed_time * 1000)
+
+    peak_alloc = 0
+    tracemalloc.start()
+    try:
+        for i, fn in enumerate(benchmark(warmup + repeat)):
+            current_alloc, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            if i >= warmup:
+                peak_alloc = max(peak_alloc, peak - current_alloc)
+    finally:
+        tracemalloc.stop()
+
+    times_ms.sort()
+    return {
+        'median_ms': statistics.median(times_ms),
+        'p95_ms': times_ms[int(0.95 * (len(times_ms) - 1))],
+        'peak_alloc_mib': peak_alloc / 2**20,
+        'iterations': len(times_ms),
+    }
+
+def check_budget(name: str, result: dict, budget: dict | None) -> list[str]:
+    if budget is None:
+        return []
+
+    violations = []
+    max_ms = budget.get('max_ms')
+    if max_ms is not None and result['median_ms'] > max_ms:
+        violations.append(f'{name}: median time of {result["median_ms"]:.3f} ms exceeds the budget of {max_ms:.3f} ms')
+
+    max_alloc_mib = budget.get('max_alloc_mib')
+    if max_alloc_mib is not None and result['peak_alloc_mib'] > max_alloc_mib:
+        violations.append(f'{name}: peak allocation of {result["peak_alloc_mib"]:.2f} MiB exceeds the budget of {max_alloc_mib:.2f} MiB')
+
+    return violations
+
+def environment_info() -> dict:
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'commit': commit,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Run micro-benchmarks for the per-frame hot paths')
+    parser.add_argument('--profile', default='default', help='The hardware profile in the budgets file to check against')
+    parser.add_argument('--budgets', default='perf_budgets.yaml', help='YAML file with per-profile, per-path budgets')
+    parser.add_argument('--history', default='perf_history.jsonl', help='Results are appended to this file')
+    parser.add_argument('--no-history', action='store_true', help="Don't record results in the history file")
+    parser.add_argument('--repeat', type=int, default=50, help='Timed iterations per benchmark')
+    parser.add_argument(
+        '--pin-mmap-threshold',
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help='Pin the malloc mmap threshold, as the app does by default when frame_memory_budget_mb is set',
+    )
+    parser.add_argument(
+        '--only',
+        action='append',
+        default=[],
+        help='Only run benchmarks whose name contains this string. Can be repeated.',
+    )
+
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    with open(args.budgets, 'r') as file:
+        profiles = yaml.safe_load(file)['profiles']
+    if args.profile not in profiles:
+        raise ValueError(f'Unknown profile: {args.profile}. Expected one of: {", ".join(profiles)}')
+    budgets = profiles[args.profile] or {}
+
+    if args.pin_mmap_threshold:
+        fm.pin_mmap_threshold()
+
+    results = {}
+    violations = []
+    for name, (benchmark, warmup) in BENCHMARKS.items():
+        if args.only and not any(pattern in name for pattern in args.only):
+            continue
+
+        result = run_benchmark(benchmark, warmup, args.repeat)
+        results[name] = result
+        violations += check_budget(name, result, budgets.get(name))
+
+        budget = budgets.get(name) or {}
+        max_ms = budget.get('max_ms')
+        budget_str = '' if max_ms is None else f' (budget {max_ms:.3f} ms)'
+        logger.info(
+            f'{name:<32} median {result["median_ms"]:9.3f} ms | '
+            f'p95 {result["p95_ms"]:9.3f} ms | '
+            f'peak alloc {result["peak_alloc_mib"]:7.2f} MiB{budget_str}'
+            )
+
+    if not args.no_history:
+        record = {
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'profile': args.profile,
+            'pin_mmap_threshold': args.pin_mmap_threshold,
+            'environment': environment_info(),
+            'results': results,
+            'violations': violations,
+        }
+        with open(args.history, 'a') as file:
+            file.write(json.dumps(record) + '\n')
+        logger.info(f'\nResults appended to {args.history}.')
+
+    if violations:
+        for violation in violations:
+            logger.error(violation)
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class SettingStats:
+    def __init__(self) -> None:
+        """
+        Running totals for the frames processed at a single detection resolution setting.
+        """
+        self.num_frames = 0
+        self.num_failures = 0
+        self.total_bytes = 0
+        self.total_latency = 0.0
+        self.total_confidence = 0.0
+        self.num_confidences = 0
+        self.objects_counted = 0
+        self.time_active = 0.0
+
+    def to_dict(self, time_active: float) -> dict:
+        """
+        time_active: total time spent at this setting, in seconds, including any time not yet added to `time_active`
+        """
+        num_frames = max(self.num_frames, 1)
+        minutes_active = time_active / 60.0
+        return {
+            'frames': self.num_frames,
+            'failures': self.num_failures,
+            'mean_bytes_per_frame': self.total_bytes / num_frames,
+            'mean_latency_sec': self.total_latency / num_frames,
+            'mean_confidence': self.total_confidence / self.num_confidences if self.num_confidences > 0 else None,
+            'objects_counted': self.objects_counted,
+            'objects_per_minute': self.objects_counted / minutes_active if minutes_active > 0 else None,
+        }
+
+class DetectionResolutionController:
+    def __init__(self,
+                 frame_period: float,
+                 min_width: int = 160,
+                 max_width: int = 640,
+                 initial_width: int = 200,
+                 min_jpeg_quality: int = 70,
+                 max_jpeg_quality: int = 95,
+                 min_object_px: int = 24,
+                 max_object_px: int = 96,
+                 min_confidence: float = 0.75,
+                 latency_budget_fraction: float = 0.6,
+                 hysteresis_frames: int = 10,
+                 cooldown_sec: float = 5.0) -> None:
+        """
+        Picks the resolution and JPEG quality of the image sent for object detection.
+
+        Settings form a ladder from (min_width, min_jpeg_quality) to (max_width, max_jpeg_quality).
+        After each frame the controller votes to:
+        - step down if a request that was sent wasn't answered (it timed out or failed), if inference
+          latency exceeds the budget, or if every object is larger than `max_object_px` and the model
+          is confident (we're paying for pixels we don't need)
+        - step up if the smallest object is smaller than `min_object_px` or the model is unconfident,
+          as long as there is latency to spare
+
+        The setting only changes after `hysteresis_frames` consecutive votes in the same direction,
+        and no sooner than `cooldown_sec` after the previous change, so the model input doesn't flap.
+        """
+        self.MIN_OBJECT_PX = min_object_px
+        self.MAX_OBJECT_PX = max_object_px
+        self.MIN_CONFIDENCE = min_confidence
+        self.LATENCY_BUDGET_FRACTION = latency_budget_fraction
+        self.LATENCY_BUDGET = frame_period * latency_budget_fraction
+        self.HYSTERESIS_FRAMES = hysteresis_frames
+        self.COOLDOWN_SEC = cooldown_sec
+
+        self.levels = self._build_levels(min_width, max_width, min_jpeg_quality, max_jpeg_quality)
+        self._level = min(range(len(self.levels)), key=lambda i: abs(self.levels[i][0] - initial_width))
+
+        self._votes = 0 # positive votes step up, negative votes step down
+        self._last_change_time = time.monotonic()
+        self._last_object_count = None
+
+        self._stats: dict[int, SettingStats] = {} # by level
+
+    def set_frame_period(self, frame_period: float) -> None:
+        self.LATENCY_BUDGET = frame_period * self.LATENCY_BUDGET_FRACTION
+
+    @property
+    def level(self) -> int:
+        """
+        The index of the current setting in `levels`. Pass this back to `update` or `record_failure`
+        along with the results of the frame encoded at this setting.
+        """
+        return self._level
+
+    @property
+    def width(self) -> int:
+        return self.levels[self._level][0]
+
+    @property
+    def jpeg_quality(self) -> int:
+        return self.levels[self._level][1]
+
+    def update(self,
+               level: int,
+               image_shape: tuple,
+               num_bytes: int,
+               latency: float,
+               confidence: float | None,
+               bbox_sizes: list[tuple[float, float]],
+               object_count: int) -> None:
+        """
+        Record an answered frame and possibly change the setting for future frames.
+
+        level: the setting the image was encoded with
+        image_shape: the shape of the image that was sent. Right after a change, this can lag behind the setting.
+        num_bytes: the size of the encoded image that was sent
+        latency: how long the request took, in seconds
+        confidence: the confidence of the answer, if available
+        bbox_sizes: normalized (width, height) of the objects currently being tracked
+        object_count: the tracker's running object count
+        """
+        height, width = image_shape[:2]
+        now = time.monotonic()
+
+        stats = self._stats.setdefault(level, SettingStats())
+        stats.num_frames += 1
+        stats.total_bytes += num_bytes
+        stats.total_latency += latency
+        if confidence is not None:
+            stats.total_confidence += confidence
+            stats.num_confidences += 1
+        if self._last_object_count is not None:
+            stats.objects_counted += object_count - self._last_object_count
+        self._last_object_count = object_count
+
+        if latency > self.LATENCY_BUDGET:
+            vote = -1
+        elif bbox_sizes:
+            smallest_object_px = min(min(w * width, h * height) for w, h in bbox_sizes)
+            unconfident = confidence is not None and confidence < self.MIN_CONFIDENCE
+
+            if smallest_object_px < self.MIN_OBJECT_PX or unconfident:
+                vote = 1
+            elif smallest_object_px > self.MAX_OBJECT_PX:
+                vote = -1
+            else:
+                vote = 0
+        else:
+            vote = 0 # nothing on the belt, nothing to learn from
+
+        self._vote(vote, now)
+
+    def record_failure(self, level: int) -> None:
+        """
+        Record a frame whose request was sent but not answered: it timed out or failed. This usually
+        means the endpoint can't keep up, so it counts as a vote to step down. Don't record requests that
+        were never sent (e.g. refused by the circuit breaker), they say nothing about the setting.
+
+        level: the setting the image was encoded with
+        """
+        self._stats.setdefault(level, SettingStats()).num_failures += 1
+        self._vote(-1, time.monotonic())
+
+    def _vote(self, vote: int, now: float) -> None:
+        if vote == 0 or (vote > 0) != (self._votes > 0):
+            self._votes = vote
+        else:
+            self._votes += vote
+
+        if abs(self._votes) < self.HYSTERESIS_FRAMES or now - self._last_change_time < self.COOLDOWN_SEC:
+            return
+
+        new_level = min(max(self._level + (1 if self._votes > 0 else -1), 0), len(self.levels) - 1)
+        self._votes = 0
+        if new_level == self._level:
+            return
+
+        previous_width, previous_quality = self.width, self.jpeg_quality
+        self._stats.setdefault(self._level, SettingStats()).time_active += now - self._last_change_time
+        self._level = new_level
+        self._last_change_time = now
+
+        logger.info(
+            f'Detection resolution changed from {previous_width}px (JPEG quality {previous_quality}) '
+            f'to {self.width}px (JPEG quality {self.jpeg_quality}).'
+            )
+        self.log_report()
+
+    def report(self) -> dict[str, dict]:
+        """
+        Returns bytes per frame, latency, confidence and counting rate for each setting that has been used.
+        """
+        now = time.monotonic()
+        report = {}
+        for level, stats in sorted(self._stats.items()):
+            time_active = stats.time_active
+            if level == self._level:
+                time_active += now - self._last_change_time
+
+            width, quality = self.levels[level]
+            report[f'{width}px@q{quality}'] = stats.to_dict(time_active)
+        return report
+
+    def log_report(self) -> None:
+        for setting, stats in self.report().items():
+            mean_confidence = '-' if stats['mean_confidence'] is None else f'{stats["mean_confidence"]:.2f}'
+            objects_per_minute = '-' if stats['objects_per_minute'] is None else f'{stats["objects_per_minute"]:.1f}'
+            logger.info(
+                f'{setting}: {stats["frames"]} frame(s) | '
+                f'{stats["failures"]} unanswered | '
+                f'{stats["mean_bytes_per_frame"] / 1024:.1f} KiB/frame | '
+                f'latency: {stats["mean_latency_sec"]:.3f}s | '
+                f'confidence: {mean_confidence} | '
+                f'objects/min: {objects_per_minute}'
+                )
+
+    @staticmethod
+    def _build_levels(min_width: int, max_width: int, min_quality: int, max_quality: int) -> list[tuple[int, int]]:
+        # Widths grow geometrically so that each step changes the pixel count by a similar ratio
+        STEP_RATIO = 1.25
+
+        widths = [min_width]
+        while widths[-1] * STEP_RATIO < max_width:
+            widths.append(int(round(widths[-1] * STEP_RATIO)))
+        if widths[-1] != max_width:
+            widths.append(max_width)
+
+        levels = []
+        for i, width in enumerate(widths):
+            fraction = i / (len(widths) - 1) if len(widths) > 1 else 1.0
+            quality = int(round(min_quality + fraction * (max_quality - min_quality)))
+            levels.append((width, quality))
+        return levels
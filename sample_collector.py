@@ -0,0 +1,194 @@
+import numpy as np
+import cv2
+import logging
+import time
+
+from collections import deque
+from threading import Thread, Lock
+from queue import Queue, Full, Empty
+from typing import Callable
+
+logger = logging.getLogger(__name__)
+
+def perceptual_hash(frame: np.ndarray) -> int:
+    """
+    Computes a 64-bit difference hash (dHash) of the frame. Visually similar frames produce hashes
+    with a small Hamming distance, regardless of small changes in resolution or compression.
+    """
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA)
+    diff = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(diff).tobytes(), 'big')
+
+def hamming_distance(hash1: int, hash2: int) -> int:
+    return (hash1 ^ hash2).bit_count()
+
+class TokenBucket:
+    def __init__(self, rate_per_sec: float, capacity: float) -> None:
+        """
+        A simple token bucket rate limiter. Tokens refill continuously at `rate_per_sec`, up to `capacity`.
+        """
+        self._rate_per_sec = rate_per_sec
+        self._capacity = capacity
+        self._tokens = capacity
+        self._last_refill_time = time.monotonic()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        self._tokens = min(self._capacity, self._tokens + (now - self._last_refill_time) * self._rate_per_sec)
+        self._last_refill_time = now
+
+        if self._tokens < 1.0:
+            return False
+
+        self._tokens -= 1.0
+        return True
+
+    def refund(self) -> None:
+        """
+        Return a token that was acquired but not used.
+        """
+        self._tokens = min(self._capacity, self._tokens + 1.0)
+
+class TrainingSampleCollector:
+    def __init__(self,
+                 submit: Callable[[np.ndarray], object],
+                 max_submissions_per_hour: int = 120,
+                 burst_size: int = 5,
+                 queue_size: int = 4,
+                 confidence_thresh: float = 0.75,
+                 min_hash_distance: int = 6,
+                 novelty_hash_distance: int = 20,
+                 dedup_index_size: int = 256) -> None:
+        """
+        Collects diverse, informative training samples in the background while the app streams video.
+
+        Each frame offered to the collector is hashed and compared to recently submitted frames.
+        A frame is submitted if it is not a near-duplicate of a recent submission and at least one of the
+        following is true:
+        - the model's answer was unconfident
+        - the number of detected objects changed since the previous frame
+        - the frame looks very different from every recent submission
+
+        Submissions are rate limited and handed to a bounded queue, which is drained by a worker thread,
+        so the frame loop never blocks on the network.
+
+        submit: called from the worker thread with each selected frame, e.g. a call to `gl.ask_async`
+        """
+        self._submit = submit
+
+        self.CONFIDENCE_THRESH = confidence_thresh
+        self.MIN_HASH_DISTANCE = min_hash_distance # anything closer than this to a recent submission is a duplicate
+        self.NOVELTY_HASH_DISTANCE = novelty_hash_distance # anything farther than this from all recent submissions is novel
+
+        # Bounded memory: only the most recent hashes are kept for deduplication
+        self._recent_hashes: deque[int] = deque(maxlen=dedup_index_size)
+
+        self._rate_limiter = TokenBucket(max_submissions_per_hour / 3600.0, burst_size)
+        self._queue: Queue = Queue(maxsize=queue_size)
+
+        self._previous_roi_count = None
+
+        self._stats_lock = Lock()
+        self._submission_times: deque[float] = deque(maxlen=max_submissions_per_hour + burst_size)
+        self._num_dropped = 0
+        self._num_failed = 0
+
+        self._running = True
+        self._thread = Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+
+    def offer(self, frame: np.ndarray, confidence: float | None, roi_count: int | None) -> bool:
+        """
+        Offer a frame to the collector. This method never blocks.
+
+        frame: the image that the model saw
+        confidence: the confidence of the model's answer, if available
+        roi_count: the number of objects detected in the frame, if available
+
+        Returns True if the frame was queued for submission.
+        """
+        count_changed = roi_count is not None and self._previous_roi_count is not None and roi_count != self._previous_roi_count
+        self._previous_roi_count = roi_count
+
+        low_confidence = confidence is not None and confidence < self.CONFIDENCE_THRESH
+
+        frame_hash = perceptual_hash(frame)
+        novelty = min((hamming_distance(frame_hash, h) for h in self._recent_hashes), default=64)
+
+        if novelty < self.MIN_HASH_DISTANCE:
+            return False
+
+        if low_confidence:
+            reason = f'low confidence ({confidence:.2f})'
+        elif count_changed:
+            reason = f'object count changed to {roi_count}'
+        elif novelty >= self.NOVELTY_HASH_DISTANCE:
+            reason = f'novel frame (hash distance {novelty})'
+        else:
+            return False
+
+        if not self._rate_limiter.try_acquire():
+            return False
+
+        try:
+            self._queue.put_nowait((frame, reason))
+        except Full:
+            self._rate_limiter.refund() # nothing was submitted, so don't count it against the rate budget
+            with self._stats_lock:
+                self._num_dropped += 1
+            logger.debug('Training sample queue full! Dropping sample.')
+            return False
+
+        self._recent_hashes.append(frame_hash)
+        return True
+
+    def stats(self) -> dict:
+        """
+        Returns the current queue depth, the number of submissions in the last hour and error counters.
+        """
+        with self._stats_lock:
+            one_hour_ago = time.monotonic() - 3600.0
+            submissions_last_hour = sum(1 for t in self._submission_times if t > one_hour_ago)
+            return {
+                'queue_depth': self._queue.qsize(),
+                'submissions_last_hour': submissions_last_hour,
+                'dropped': self._num_dropped,
+                'failed': self._num_failed,
+            }
+
+    def stop(self, timeout: float = 1.0) -> None:
+        """
+        Stop the worker thread. A submission that is still waiting on the network is abandoned after `timeout`
+        seconds, so that shutdown can't hang.
+        """
+        self._running = False
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.warning('Abandoned a training sample submission that did not finish in time.')
+
+    def _run_loop(self) -> None:
+        while self._running:
+            try:
+                frame, reason = self._queue.get(timeout=0.1)
+            except Empty:
+                continue
+
+            try:
+                self._submit(frame)
+            except Exception:
+                with self._stats_lock:
+                    self._num_failed += 1
+                logger.error('Encountered an unexpected error while submitting a training sample', exc_info=True)
+                continue
+
+            with self._stats_lock:
+                self._submission_times.append(time.monotonic())
+
+            stats = self.stats()
+            logger.info(
+                f'Submitted training sample: {reason}. '
+                f'Queue depth: {stats["queue_depth"]} | '
+                f'Submissions in the last hour: {stats["submissions_last_hour"]}'
+                )
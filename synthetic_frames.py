@@ -0,0 +1,26 @@
+import cv2
+import numpy as np
+
+RESOLUTIONS = {
+    '1080p': (1920, 1080),
+    '4k': (3840, 2160),
+}
+
+def synthetic_frame(width: int, height: int) -> np.ndarray:
+    """
+    A deterministic frame that compresses roughly like a real camera frame: a gradient background,
+    some solid objects and a little sensor noise.
+    """
+    rng = np.random.default_rng(0)
+
+    gradient = np.linspace(40, 200, width, dtype=np.float32)
+    frame = np.repeat(gradient[np.newaxis, :, np.newaxis], height, axis=0).repeat(3, axis=2)
+
+    for _ in range(10):
+        x, y = int(rng.integers(0, width)), int(rng.integers(0, height))
+        size = int(rng.integers(height // 20, height // 5))
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.rectangle(frame, (x, y), (x + size, y + size), color, -1)
+
+    frame += rng.normal(0, 3, frame.shape).astype(np.float32)
+    return np.clip(frame, 0, 255).astype(np.uint8)
@@ -0,0 +1,317 @@
+import datetime
+import math
+import time
+
+from collections import deque
+from threading import Lock
+from typing import Callable
+
+# The running totals tracked by the rollups. Each is cumulative since startup, so the total for any
+# time range is the difference between two snapshots.
+FIELDS = ('count', 'idle_sec', 'velocity_sum', 'velocity_samples')
+
+class RingBuckets:
+    def __init__(self, bucket_sec: int, num_buckets: int) -> None:
+        """
+        A fixed-size ring of time buckets. Each bucket holds a snapshot of the running totals as of the
+        end of that bucket, so the totals for a range of buckets can be computed from two lookups.
+
+        Memory is allocated once, up front, and never grows.
+        """
+        self.bucket_sec = bucket_sec
+        self.num_buckets = num_buckets
+
+        self._bucket_ids = [-1] * num_buckets
+        self._snapshots = [[0.0] * len(FIELDS) for _ in range(num_buckets)]
+        self._first_bucket_id = None
+        self._current_bucket_id = None
+
+    def update(self, now: float, totals: list[float]) -> None:
+        bucket_id = int(now // self.bucket_sec)
+
+        # Buckets that were skipped (e.g. no frames for a while) inherit the previous totals, so that every
+        # bucket in the window holds a valid snapshot. This is bounded by the size of the ring.
+        if self._current_bucket_id is not None and bucket_id > self._current_bucket_id + 1:
+            previous_snapshot = self._snapshots[self._current_bucket_id % self.num_buckets]
+            first_skipped_id = max(self._current_bucket_id + 1, bucket_id - self.num_buckets)
+            for skipped_id in range(first_skipped_id, bucket_id):
+                idx = skipped_id % self.num_buckets
+                self._bucket_ids[idx] = skipped_id
+                self._snapshots[idx][:] = previous_snapshot
+
+        idx = bucket_id % self.num_buckets
+        self._bucket_ids[idx] = bucket_id
+        self._snapshots[idx][:] = totals
+        self._current_bucket_id = bucket_id
+        if self._first_bucket_id is None:
+            self._first_bucket_id = bucket_id
+
+    def earliest_start(self) -> float | None:
+        """
+        Returns the earliest time that a range query can start from, or None if no data has been recorded.
+        A range starting at a bucket needs the snapshot from the bucket before it.
+        """
+        if self._current_bucket_id is None:
+            return None
+        earliest_id = max(self._first_bucket_id, self._current_bucket_id - self.num_buckets + 2)
+        return earliest_id * self.bucket_sec
+
+    def covers(self, t: float) -> bool:
+        """
+        Returns True if a range query starting at time t can be answered exactly: either t is within the ring,
+        or the ring still holds everything since the first update (so there's nothing to miss before it).
+        """
+        earliest_start = self.earliest_start()
+        if earliest_start is None:
+            return False
+        return t >= earliest_start or earliest_start == self._first_bucket_id * self.bucket_sec
+
+    def totals_at(self, t: float) -> list[float] | None:
+        """
+        Returns the running totals as of the end of the bucket containing time t, or None if that bucket
+        is no longer (or not yet) in the ring.
+        """
+        bucket_id = int(t // self.bucket_sec)
+        if self._first_bucket_id is not None and bucket_id == self._first_bucket_id - 1:
+            return [0.0] * len(FIELDS) # nothing had happened before the first bucket
+        idx = bucket_id % self.num_buckets
+        if self._bucket_ids[idx] != bucket_id:
+            return None
+        return self._snapshots[idx]
+
+class ThroughputRollups:
+    def __init__(self,
+                 min_idle_gap_sec: float = 30.0,
+                 max_frame_gap_sec: float = 2.0,
+                 num_recent_gaps: int = 100,
+                 clock: Callable[[], float] = time.time) -> None:
+        """
+        Fixed-memory rollups of item counts, mean object velocity and belt idle time, at per-second,
+        per-minute and per-hour resolution. Range queries are answered in constant time from the bucket
+        snapshots, without scanning raw events, and memory stays flat no matter how long the app runs.
+
+        The belt is considered idle whenever no moving objects are seen. Idle periods of at least
+        `min_idle_gap_sec` are remembered as gaps (the most recent `num_recent_gaps` of them).
+
+        max_frame_gap_sec: caps the time credited to a single frame, so that time the app wasn't running
+            isn't counted as idle time
+        """
+        self.MIN_IDLE_GAP_SEC = min_idle_gap_sec
+        self.MAX_FRAME_GAP_SEC = max_frame_gap_sec
+
+        self._clock = clock
+        self._lock = Lock()
+
+        self._totals = [0.0] * len(FIELDS)
+        self.resolutions = {
+            'second': RingBuckets(1, 3600), # 1 hour
+            'minute': RingBuckets(60, 24 * 60), # 1 day
+            'hour': RingBuckets(3600, 90 * 24), # 90 days
+        }
+
+        self._last_frame_time = None
+        self._idle_start_time = None
+        self._recent_gaps: deque[tuple[float, float]] = deque(maxlen=num_recent_gaps)
+
+    def record_count(self) -> None:
+        """
+        Record that an object was counted.
+        """
+        with self._lock:
+            self._totals[FIELDS.index('count')] += 1
+            self._update_buckets(self._clock())
+
+    def record_frame(self, velocities: list[float]) -> None:
+        """
+        Record a processed frame.
+
+        velocities: the velocities of the moving objects seen in the frame, in normalized screen units per second.
+            An empty list means the belt looked idle.
+        """
+        with self._lock:
+            now = self._clock()
+            dt = 0.0 if self._last_frame_time is None else min(now - self._last_frame_time, self.MAX_FRAME_GAP_SEC)
+            self._last_frame_time = now
+
+            if velocities:
+                self._totals[FIELDS.index('velocity_sum')] += sum(velocities) / len(velocities)
+                self._totals[FIELDS.index('velocity_samples')] += 1
+
+                if self._idle_start_time is not None:
+                    if now - self._idle_start_time >= self.MIN_IDLE_GAP_SEC:
+                        self._recent_gaps.append((self._idle_start_time, now))
+                    self._idle_start_time = None
+            else:
+                self._totals[FIELDS.index('idle_sec')] += dt
+                if self._idle_start_time is None:
+                    self._idle_start_time = now - dt
+
+            self._update_buckets(now)
+
+    def query(self, start: float, end: float) -> dict:
+        """
+        Returns the count, rates, idle time and mean velocity between two wall-clock times (seconds since the epoch).
+        Uses the finest resolution that still covers `start`. The range is widened to the edges of the buckets
+        at that resolution, and the returned `start` and `end` (and the span the rates are computed over) are
+        the widened range. Ranges that start and end on bucket boundaries (e.g. shifts that start on the hour)
+        are answered as asked.
+        """
+        if end <= start:
+            raise ValueError('end must be after start')
+
+        with self._lock:
+            now = self._clock()
+            end = max(min(end, now), start)
+
+            for resolution, buckets in self.resolutions.items():
+                if buckets.covers(start):
+                    break
+            # If even the coarsest resolution doesn't go back far enough, answer from what's left
+
+            earliest_start = buckets.earliest_start()
+            if earliest_start is None or end <= earliest_start:
+                # Nothing was recorded in the range, e.g. a shift that ended before the app started
+                end_totals = start_totals = self._totals
+            else:
+                # Snap the range outward to the edges of the buckets whose snapshots are used, so that the totals
+                # and the span they're divided by match
+                bucket_sec = buckets.bucket_sec
+                start = max(start // bucket_sec * bucket_sec, earliest_start)
+                if end >= now:
+                    end_totals = self._totals
+                    end = now
+                else:
+                    end = min(math.ceil(end / bucket_sec) * bucket_sec, now)
+                    end_totals = buckets.totals_at(end - bucket_sec)
+                # Totals at the start are the snapshot from the end of the previous bucket
+                start_totals = buckets.totals_at(start - bucket_sec)
+
+                # Buckets after the most recent update aren't in the ring yet, but nothing has changed since then
+                if end_totals is None:
+                    end_totals = self._totals
+                if start_totals is None:
+                    start_totals = self._totals
+
+            deltas = dict(zip(FIELDS, (e - s for e, s in zip(end_totals, start_totals))))
+
+        elapsed_min = max(end - start, 1e-9) / 60.0
+        return {
+            'start': start,
+            'end': end,
+            'resolution': resolution,
+            'count': int(deltas['count']),
+            'items_per_minute': deltas['count'] / elapsed_min,
+            'items_per_hour': deltas['count'] / elapsed_min * 60.0,
+            'idle_sec': deltas['idle_sec'],
+            'mean_velocity': deltas['velocity_sum'] / deltas['velocity_samples'] if deltas['velocity_samples'] > 0 else None,
+        }
+
+    def counts_over_time(self, resolution: str, start: float, end: float) -> list[dict]:
+        """
+        Returns the count for each bucket between start and end at the given resolution.
+        """
+        if resolution not in self.resolutions:
+            raise ValueError(f'Unexpected resolution: {resolution}. Expected one of: {", ".join(self.resolutions)}')
+
+        buckets = self.resolutions[resolution]
+        count_idx = FIELDS.index('count')
+        with self._lock:
+            earliest_start = buckets.earliest_start()
+            if earliest_start is None:
+                return []
+
+            end = min(end, self._clock())
+            bucket_start = max(start // buckets.bucket_sec * buckets.bucket_sec, earliest_start)
+
+            series = []
+            previous_totals = buckets.totals_at(bucket_start - buckets.bucket_sec)
+            previous_count = self._totals[count_idx] if previous_totals is None else previous_totals[count_idx]
+            while bucket_start <= end and len(series) < buckets.num_buckets:
+                totals = buckets.totals_at(bucket_start)
+                count = previous_count if totals is None else totals[count_idx]
+                series.append({'start': bucket_start, 'count': int(count - previous_count)})
+                previous_count = count
+                bucket_start += buckets.bucket_sec
+            return series
+
+    def idle_gaps(self) -> list[dict]:
+        """
+        Returns the most recent idle gaps, including the current one if the belt is idle right now.
+        """
+        with self._lock:
+            gaps = [{'start': start, 'end': end, 'duration_sec': end - start} for start, end in self._recent_gaps]
+            if self._idle_start_time is not None:
+                now = self._clock()
+                if now - self._idle_start_time >= self.MIN_IDLE_GAP_SEC:
+                    gaps.append({'start': self._idle_start_time, 'end': None, 'duration_sec': now - self._idle_start_time})
+            return gaps
+
+    def _update_buckets(self, now: float) -> None:
+        for buckets in self.resolutions.values():
+            buckets.update(now, self._totals)
+
+def _parse_time_range(args: dict, default_duration_sec: float) -> tuple[float, float]:
+    try:
+        end = float(args['end']) if 'end' in args else time.time()
+        start = float(args['start']) if 'start' in args else end - default_duration_sec
+    except ValueError:
+        raise ValueError('start and end must be numbers of seconds since the epoch')
+    return start, end
+
+def parse_shift_starts(shift_starts: list[str]) -> list[datetime.time]:
+    """
+    Parses shift start times given as 'HH:MM' strings, in local time.
+    """
+    if not shift_starts:
+        raise ValueError('At least one shift start time is required')
+    try:
+        return sorted(datetime.datetime.strptime(str(shift_start), '%H:%M').time() for shift_start in shift_starts)
+    except ValueError:
+        raise ValueError(f"Shift start times must be quoted 'HH:MM' strings, got: {shift_starts}")
+
+def shift_bounds(now: float, shift_starts: list[datetime.time]) -> tuple[float, float]:
+    """
+    Returns the start times (seconds since the epoch) of the previous shift and the current shift.
+    """
+    today = datetime.date.fromtimestamp(now)
+    starts = sorted(
+        datetime.datetime.combine(today + datetime.timedelta(days=days), shift_start).timestamp()
+        for days in (-2, -1, 0)
+        for shift_start in shift_starts
+    )
+    current_idx = max(i for i, start in enumerate(starts) if start <= now)
+    return starts[current_idx - 1], starts[current_idx]
+
+def add_throughput_endpoints(web_server, rollups: ThroughputRollups, shift_starts: list[str]) -> None:
+    """
+    Adds JSON endpoints for the rollups to a FrameGrabWebServer:
+    - /throughput?start=<epoch sec>&end=<epoch sec>: totals and rates for a time range (default: the last hour)
+    - /throughput/summary: the last minute, last hour, current shift and previous shift, plus recent idle gaps
+    - /throughput/counts?resolution=<second|minute|hour>&start=<epoch sec>&end=<epoch sec>: counts per bucket
+    """
+    def throughput(args: dict) -> dict:
+        start, end = _parse_time_range(args, 3600.0)
+        return rollups.query(start, end)
+
+    shift_start_times = parse_shift_starts(shift_starts)
+
+    def summary(args: dict) -> dict:
+        now = time.time()
+        previous_shift_start, current_shift_start = shift_bounds(now, shift_start_times)
+        return {
+            'last_minute': rollups.query(now - 60.0, now),
+            'last_hour': rollups.query(now - 3600.0, now),
+            'current_shift': rollups.query(current_shift_start, now),
+            'previous_shift': rollups.query(previous_shift_start, current_shift_start),
+            'idle_gaps': rollups.idle_gaps(),
+        }
+
+    def counts(args: dict) -> list[dict]:
+        resolution = args.get('resolution', 'minute')
+        default_duration_sec = rollups.resolutions.get(resolution, rollups.resolutions['minute']).bucket_sec * 60.0
+        start, end = _parse_time_range(args, default_duration_sec)
+        return rollups.counts_over_time(resolution, start, end)
+
+    web_server.register_json_endpoint('/throughput', throughput)
+    web_server.register_json_endpoint('/throughput/summary', summary)
+    web_server.register_json_endpoint('/throughput/counts', counts)
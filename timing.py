@@ -41,6 +41,9 @@ class PerfTimer:
 class LoopManager:
     def __init__(self, loop_name: str, loop_time: float) -> None:
         self._loop_name = loop_name
+        self.set_loop_time(loop_time)
+        
+    def set_loop_time(self, loop_time: float) -> None:
         self._loop_time = loop_time
         self._target_fps = 1.0 / loop_time if loop_time > 0 else float('inf')
         
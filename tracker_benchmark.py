@@ -0,0 +1,151 @@
+"""
+Scores the ObjectTracker's counting accuracy and speed on simulated conveyor belts.
+
+Runs the tracker over a grid of simulated scenarios (belt speed, object density, dropouts, etc.) and
+reports the count error and tracker time per frame for each. Exits with a non-zero status if the
+results exceed the given accuracy or speed limits, so tracker changes can be gated on both.
+
+Usage:
+    python tracker_benchmark.py
+    python tracker_benchmark.py --grid belt_speed=0.2,0.4,0.8 --grid dropout_rate=0,0.2 --distance-matching-thresh 0.15
+    python tracker_benchmark.py --max-mean-abs-error-pct 5 --max-ms-per-frame 1.0
+"""
+import argparse
+import itertools
+import json
+import logging
+import statistics
+import time
+
+import object_tracking as ot
+from conveyor_simulator import ConveyorSimulator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRID = {
+    'belt_speed': [0.2, 0.4, 0.8],
+    'speed_variation': [0.0, 0.3],
+    'object_density': [0.5, 1.5],
+    'object_size': [0.12],
+    'size_variation': [0.3],
+    'dropout_rate': [0.0, 0.2],
+    'position_jitter': [0.005],
+    'false_positive_rate': [0.0, 0.1],
+    'inference_fps': [2.0, 5.0],
+}
+
+def run_scenario(scenario: dict, tracker_params: dict, duration: float, seed: int) -> dict:
+    simulator = ConveyorSimulator(**scenario, seed=seed)
+
+    tracker = ot.ObjectTracker(tracker_params['expected_x_velocity'], 0.0)
+    tracker.DISTANCE_MATCHING_THRESH = tracker_params['distance_matching_thresh']
+    tracker.MAX_TIME_SINCE_LAST_SEEN = tracker_params['max_time_since_last_seen']
+    tracker.MIN_DISTANCE_TRAVELED_THRESH = tracker_params['min_distance_traveled_thresh']
+
+    frame_times = []
+    timestamp = 0.0
+    for timestamp, rois in simulator.run(duration):
+        start_time = time.perf_counter()
+        tracker.add_rois(rois, timestamp)
+        tracker.purge_missing_objects()
+        frame_times.append(time.perf_counter() - start_time)
+
+    # Let any remaining tracks expire so that they are counted
+    tracker.add_rois([], timestamp + tracker.MAX_TIME_SINCE_LAST_SEEN + 1.0)
+    tracker.purge_missing_objects()
+
+    true_count = simulator.ground_truth_count
+    error = tracker.object_count - true_count
+    frame_times_ms = sorted(t * 1000 for t in frame_times)
+    return {
+        **scenario,
+        'true_count': true_count,
+        'tracked_count': tracker.object_count,
+        'error': error,
+        'abs_error_pct': 100.0 * abs(error) / true_count if true_count > 0 else 0.0,
+        'mean_ms_per_frame': statistics.fmean(frame_times_ms),
+        'p99_ms_per_frame': frame_times_ms[int(0.99 * (len(frame_times_ms) - 1))],
+        'frames': len(frame_times_ms),
+    }
+
+def parse_grid(grid_args: list[str]) -> dict:
+    grid = dict(DEFAULT_GRID)
+    for grid_arg in grid_args:
+        key, _, values = grid_arg.partition('=')
+        if key not in DEFAULT_GRID:
+            raise ValueError(f'Unexpected grid parameter: {key}. Expected one of: {", ".join(DEFAULT_GRID)}')
+        grid[key] = [float(value) for value in values.split(',')]
+    return grid
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the object tracker on simulated conveyor belts')
+    parser.add_argument(
+        '--grid',
+        action='append',
+        default=[],
+        help='Override a grid parameter, e.g. --grid belt_speed=0.2,0.4. Can be repeated.',
+    )
+    parser.add_argument('--duration', type=float, default=60.0, help='Simulated seconds per scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--expected-x-velocity', type=float, default=0.4)
+    parser.add_argument('--distance-matching-thresh', type=float, default=0.1)
+    parser.add_argument('--max-time-since-last-seen', type=float, default=0.5)
+    parser.add_argument('--min-distance-traveled-thresh', type=float, default=0.5)
+    parser.add_argument('--max-mean-abs-error-pct', type=float, default=None, help='Fail if the mean absolute count error exceeds this')
+    parser.add_argument('--max-ms-per-frame', type=float, default=None, help='Fail if the mean tracker time per frame exceeds this')
+    parser.add_argument('--output', default=None, help='Write the per-scenario results to this JSON file')
+
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    grid = parse_grid(args.grid)
+    tracker_params = {
+        'expected_x_velocity': args.expected_x_velocity,
+        'distance_matching_thresh': args.distance_matching_thresh,
+        'max_time_since_last_seen': args.max_time_since_last_seen,
+        'min_distance_traveled_thresh': args.min_distance_traveled_thresh,
+    }
+
+    results = []
+    for values in itertools.product(*grid.values()):
+        scenario = dict(zip(grid.keys(), values))
+        result = run_scenario(scenario, tracker_params, args.duration, args.seed)
+        results.append(result)
+
+        scenario_str = ' '.join(f'{key}={value:g}' for key, value in scenario.items())
+        logger.info(
+            f'{scenario_str} | '
+            f'count: {result["tracked_count"]}/{result["true_count"]} ({result["error"]:+d}) | '
+            f'{result["mean_ms_per_frame"]:.3f} ms/frame (p99 {result["p99_ms_per_frame"]:.3f})'
+            )
+
+    mean_abs_error_pct = statistics.fmean(r['abs_error_pct'] for r in results)
+    max_abs_error_pct = max(r['abs_error_pct'] for r in results)
+    mean_ms_per_frame = statistics.fmean(r['mean_ms_per_frame'] for r in results)
+
+    logger.info(
+        f'\n{len(results)} scenario(s) | '
+        f'mean abs count error: {mean_abs_error_pct:.1f}% (worst {max_abs_error_pct:.1f}%) | '
+        f'mean tracker time: {mean_ms_per_frame:.3f} ms/frame'
+        )
+
+    if args.output is not None:
+        with open(args.output, 'w') as file:
+            json.dump({'tracker_params': tracker_params, 'results': results}, file, indent=2)
+
+    failed = False
+    if args.max_mean_abs_error_pct is not None and mean_abs_error_pct > args.max_mean_abs_error_pct:
+        logger.error(f'Mean abs count error of {mean_abs_error_pct:.1f}% exceeds the limit of {args.max_mean_abs_error_pct:.1f}%.')
+        failed = True
+    if args.max_ms_per_frame is not None and mean_ms_per_frame > args.max_ms_per_frame:
+        logger.error(f'Mean tracker time of {mean_ms_per_frame:.3f} ms/frame exceeds the limit of {args.max_ms_per_frame:.3f} ms/frame.')
+        failed = True
+
+    if failed:
+        exit(1)
+
+if __name__ == '__main__':
+    main()